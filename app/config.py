@@ -11,6 +11,7 @@ class Settings(BaseSettings):
     # Server settings
     app_host: str = "0.0.0.0"
     app_port: int = 8080
+    debug: bool = False
     
     # File handling
     max_file_size_mb: int = 2048
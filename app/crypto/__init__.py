@@ -1,11 +1,12 @@
 """Cryptography modules for E4P."""
 
-from .kdf import derive_key
+from .kdf import derive_key, aderive_key
 from .aead import AESGCMEncryptor, XChaCha20Poly1305Encryptor
 from .container import E4PContainer, E4PHeader
 
 __all__ = [
     "derive_key",
+    "aderive_key",
     "AESGCMEncryptor", 
     "XChaCha20Poly1305Encryptor",
     "E4PContainer",
@@ -2,15 +2,30 @@
 
 import os
 from abc import ABC, abstractmethod
-from typing import Tuple, AsyncGenerator
+from functools import lru_cache
+from typing import AsyncGenerator, Iterable, Iterator, List, Tuple
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from nacl.secret import SecretBox
+from nacl.bindings import (
+    crypto_aead_xchacha20poly1305_ietf_decrypt,
+    crypto_aead_xchacha20poly1305_ietf_encrypt,
+    crypto_secretbox,
+    crypto_secretbox_open
+)
 from nacl.utils import random
 
 
+@lru_cache(maxsize=64)
+def _aesgcm_cipher(key: bytes) -> AESGCM:
+    """Return a cached AESGCM instance so the expanded key schedule is reused."""
+    return AESGCM(key)
+
+
 class AEADEncryptor(ABC):
     """Abstract base class for AEAD encryption."""
     
+    # Bytes added to every chunk by encrypt_chunk
+    overhead: int = 16
+    
     @abstractmethod
     def encrypt_chunk(self, data: bytes, nonce: bytes) -> bytes:
         """Encrypt a chunk of data."""
@@ -39,7 +54,7 @@ class AESGCMEncryptor(AEADEncryptor):
         if len(key) != 32:
             raise ValueError("AES-256-GCM requires a 32-byte key")
         self.key = key
-        self.cipher = AESGCM(key)
+        self.cipher = _aesgcm_cipher(bytes(key))
     
     def encrypt_chunk(self, data: bytes, nonce: bytes) -> bytes:
         """Encrypt data using AES-256-GCM."""
@@ -63,34 +78,28 @@ class AESGCMEncryptor(AEADEncryptor):
 
 
 class XChaCha20Poly1305Encryptor(AEADEncryptor):
-    """XChaCha20-Poly1305 encryption implementation."""
+    """XChaCha20-Poly1305 (IETF) encryption implementation."""
+    
+    # Poly1305 tag; the nonce lives in the E4P header
+    overhead = 16
     
     def __init__(self, key: bytes):
         if len(key) != 32:
             raise ValueError("XChaCha20-Poly1305 requires a 32-byte key")
-        self.key = key
-        self.box = SecretBox(key)
+        self.key = bytes(key)
     
     def encrypt_chunk(self, data: bytes, nonce: bytes) -> bytes:
         """Encrypt data using XChaCha20-Poly1305."""
         if len(nonce) != 24:
             raise ValueError("XChaCha20-Poly1305 requires a 24-byte nonce")
-        # XChaCha20-Poly1305 encrypts and returns nonce + ciphertext + tag
-        # We need to prepend our own nonce to match the expected format
-        encrypted = self.box.encrypt(data, nonce)
-        return nonce + encrypted[24:]  # Remove the nonce from encrypted data and add our own
+        # libsodium picks its SIMD ChaCha20/Poly1305 implementation at runtime
+        return crypto_aead_xchacha20poly1305_ietf_encrypt(bytes(data), None, nonce, self.key)
     
     def decrypt_chunk(self, data: bytes, nonce: bytes) -> bytes:
         """Decrypt data using XChaCha20-Poly1305."""
         if len(nonce) != 24:
             raise ValueError("XChaCha20-Poly1305 requires a 24-byte nonce")
-        # For XChaCha20-Poly1305, the data contains nonce + ciphertext + tag
-        # We need to extract just the ciphertext + tag part
-        if len(data) < 24:
-            raise ValueError("Invalid encrypted data length")
-        # Remove the nonce from the beginning
-        ciphertext = data[24:]
-        return self.box.decrypt(ciphertext, nonce)
+        return crypto_aead_xchacha20poly1305_ietf_decrypt(bytes(data), None, nonce, self.key)
     
     def generate_nonce(self) -> bytes:
         """Generate a 24-byte nonce for XChaCha20-Poly1305."""
@@ -101,6 +110,112 @@ class XChaCha20Poly1305Encryptor(AEADEncryptor):
         return "XCHACHA20-POLY1305"
 
 
+class XSalsa20Poly1305Encryptor(AEADEncryptor):
+    """
+    XSalsa20-Poly1305 (libsodium secretbox) implementation.
+    
+    Earlier versions wrote files labelled XCHACHA20-POLY1305 with this
+    construction; it is kept so those files can still be decrypted.
+    """
+    
+    # Poly1305 tag; the nonce lives in the E4P header
+    overhead = 16
+    
+    # Files written before the nonce moved to the header also carried a
+    # copy of the 24-byte nonce in front of every chunk
+    legacy_overhead = 24 + 16
+    
+    def __init__(self, key: bytes):
+        if len(key) != 32:
+            raise ValueError("XSalsa20-Poly1305 requires a 32-byte key")
+        self.key = bytes(key)
+    
+    def encrypt_chunk(self, data: bytes, nonce: bytes) -> bytes:
+        """Encrypt data using XSalsa20-Poly1305."""
+        if len(nonce) != 24:
+            raise ValueError("XSalsa20-Poly1305 requires a 24-byte nonce")
+        # Call libsodium directly: returns ciphertext + tag without the
+        # nonce, so no intermediate EncryptedMessage is built and sliced
+        return crypto_secretbox(data, nonce, self.key)
+    
+    def decrypt_chunk(self, data: bytes, nonce: bytes) -> bytes:
+        """Decrypt data using XSalsa20-Poly1305."""
+        if len(nonce) != 24:
+            raise ValueError("XSalsa20-Poly1305 requires a 24-byte nonce")
+        return crypto_secretbox_open(data, nonce, self.key)
+    
+    def decrypt_legacy_chunk(self, data: bytes, nonce: bytes) -> bytes:
+        """Decrypt a chunk in the legacy nonce + ciphertext + tag layout."""
+        if len(nonce) != 24:
+            raise ValueError("XSalsa20-Poly1305 requires a 24-byte nonce")
+        if len(data) < 24:
+            raise ValueError("Invalid encrypted data length")
+        # Skip the nonce prefix without copying the ciphertext
+        return crypto_secretbox_open(memoryview(data)[24:], nonce, self.key)
+    
+    def generate_nonce(self) -> bytes:
+        """Generate a 24-byte nonce for XSalsa20-Poly1305."""
+        return random(24)
+    
+    def get_algorithm_name(self) -> str:
+        """Get algorithm name."""
+        return "XSALSA20-POLY1305"
+
+
+def derive_chunk_nonce(base_nonce: bytes, index: int) -> bytes:
+    """
+    Derive the nonce for a chunk from the base nonce and the chunk index.
+    
+    The index is XORed into the last 8 bytes of the base nonce, so every
+    chunk of a stream gets a distinct nonce without fresh randomness.
+    
+    Args:
+        base_nonce: Nonce stored in the E4P header
+        index: Zero-based chunk index
+    
+    Returns:
+        Nonce bytes of the same length as base_nonce
+    """
+    counter = int.from_bytes(base_nonce[-8:], 'big') ^ index
+    return base_nonce[:-8] + counter.to_bytes(8, 'big')
+
+
+def derive_chunk_nonces(base_nonce: bytes, start: int, count: int) -> List[bytes]:
+    """
+    Derive the nonces for a run of consecutive chunks.
+    
+    Equivalent to calling derive_chunk_nonce for each index, but the base
+    nonce is split and converted only once per run.
+    
+    Args:
+        base_nonce: Nonce stored in the E4P header
+        start: Index of the first chunk
+        count: Number of chunks
+    
+    Returns:
+        List of nonces for chunks start .. start + count - 1
+    """
+    prefix = base_nonce[:-8]
+    counter = int.from_bytes(base_nonce[-8:], 'big')
+    return [
+        prefix + (counter ^ index).to_bytes(8, 'big')
+        for index in range(start, start + count)
+    ]
+
+
+# Supported algorithms and their nonce sizes in bytes
+_ENCRYPTORS = {
+    "AES-256-GCM": AESGCMEncryptor,
+    "XCHACHA20-POLY1305": XChaCha20Poly1305Encryptor,
+    "XSALSA20-POLY1305": XSalsa20Poly1305Encryptor,
+}
+_NONCE_SIZES = {
+    "AES-256-GCM": 12,
+    "XCHACHA20-POLY1305": 24,
+    "XSALSA20-POLY1305": 24,
+}
+
+
 def create_encryptor(algorithm: str, key: bytes) -> AEADEncryptor:
     """
     Create an encryptor instance based on algorithm name.
@@ -108,19 +223,90 @@ def create_encryptor(algorithm: str, key: bytes) -> AEADEncryptor:
     Args:
         algorithm: Algorithm name ("AES-256-GCM" or "XCHACHA20-POLY1305")
         key: Encryption key
-        
+    
     Returns:
         AEADEncryptor instance
-        
+    
     Raises:
         ValueError: If algorithm is not supported
     """
-    if algorithm == "AES-256-GCM":
-        return AESGCMEncryptor(key)
-    elif algorithm == "XCHACHA20-POLY1305":
-        return XChaCha20Poly1305Encryptor(key)
-    else:
-        raise ValueError(f"Unsupported algorithm: {algorithm}")
+    try:
+        encryptor_class = _ENCRYPTORS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unsupported algorithm: {algorithm}") from None
+    return encryptor_class(key)
+
+
+def get_nonce_size(algorithm: str) -> int:
+    """
+    Get the nonce size for an algorithm.
+    
+    Args:
+        algorithm: Algorithm name
+    
+    Returns:
+        Nonce size in bytes
+    
+    Raises:
+        ValueError: If algorithm is not supported
+    """
+    try:
+        return _NONCE_SIZES[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown algorithm: {algorithm}") from None
+
+
+def _seal_prefixed(encryptor: AEADEncryptor, chunk: bytes) -> bytes:
+    """Encrypt a chunk under a fresh random nonce and prepend the nonce."""
+    nonce = encryptor.generate_nonce()
+    return nonce + encryptor.encrypt_chunk(chunk, nonce)
+
+
+def _open_prefixed(encryptor: AEADEncryptor, chunk: bytes, nonce_size: int) -> bytes:
+    """Decrypt a chunk produced by _seal_prefixed."""
+    return encryptor.decrypt_chunk(chunk[nonce_size:], chunk[:nonce_size])
+
+
+def encrypt_stream_sync(
+    encryptor: AEADEncryptor,
+    chunks: Iterable[bytes]
+) -> Iterator[bytes]:
+    """
+    Synchronous variant of encrypt_stream for callers without an event loop.
+    
+    Args:
+        encryptor: AEAD encryptor instance
+        chunks: Iterable of data chunks
+    
+    Yields:
+        Nonce-prefixed encrypted chunks
+    """
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        yield _seal_prefixed(encryptor, chunk)
+
+
+def decrypt_stream_sync(
+    encryptor: AEADEncryptor,
+    chunks: Iterable[bytes],
+    nonce_size: int
+) -> Iterator[bytes]:
+    """
+    Synchronous variant of decrypt_stream.
+    
+    Args:
+        encryptor: AEAD encryptor instance
+        chunks: Iterable of nonce-prefixed encrypted chunks
+        nonce_size: Size of nonce in bytes
+    
+    Yields:
+        Decrypted data chunks
+    """
+    for chunk in chunks:
+        if len(chunk) <= nonce_size:
+            continue
+        yield _open_prefixed(encryptor, chunk, nonce_size)
 
 
 async def encrypt_stream(
@@ -135,22 +321,16 @@ async def encrypt_stream(
         encryptor: AEAD encryptor instance
         input_stream: Async generator yielding data chunks
         chunk_size: Size of chunks to process
-        
+    
     Yields:
         Encrypted data chunks
     """
     async for chunk in input_stream:
         if len(chunk) == 0:
             continue
-            
-        # Generate nonce for this chunk
-        nonce = encryptor.generate_nonce()
-        
-        # Encrypt the chunk
-        encrypted_chunk = encryptor.encrypt_chunk(chunk, nonce)
         
         # Yield nonce + encrypted data
-        yield nonce + encrypted_chunk
+        yield _seal_prefixed(encryptor, chunk)
 
 
 async def decrypt_stream(
@@ -165,19 +345,62 @@ async def decrypt_stream(
         encryptor: AEAD encryptor instance
         input_stream: Async generator yielding encrypted data chunks
         nonce_size: Size of nonce in bytes
-        
+    
     Yields:
         Decrypted data chunks
     """
     async for chunk in input_stream:
         if len(chunk) <= nonce_size:
             continue
-            
-        # Split nonce and encrypted data
-        nonce = chunk[:nonce_size]
-        encrypted_data = chunk[nonce_size:]
         
-        # Decrypt the chunk
-        decrypted_chunk = encryptor.decrypt_chunk(encrypted_data, nonce)
+        yield _open_prefixed(encryptor, chunk, nonce_size)
+
+
+async def encrypt_stream_counter(
+    encryptor: AEADEncryptor,
+    input_stream: AsyncGenerator[bytes, None],
+    base_nonce: bytes
+) -> AsyncGenerator[bytes, None]:
+    """
+    Encrypt a stream of data using per-chunk counter nonces.
+    
+    Args:
+        encryptor: AEAD encryptor instance
+        input_stream: Async generator yielding data chunks
+        base_nonce: Base nonce the chunk nonces are derived from
+    
+    Yields:
+        Encrypted data chunks (without nonce prefix)
+    """
+    index = 0
+    async for chunk in input_stream:
+        if len(chunk) == 0:
+            continue
+        
+        yield encryptor.encrypt_chunk(chunk, derive_chunk_nonce(base_nonce, index))
+        index += 1
+
+
+async def decrypt_stream_counter(
+    encryptor: AEADEncryptor,
+    input_stream: AsyncGenerator[bytes, None],
+    base_nonce: bytes
+) -> AsyncGenerator[bytes, None]:
+    """
+    Decrypt a stream produced by encrypt_stream_counter.
+    
+    Args:
+        encryptor: AEAD encryptor instance
+        input_stream: Async generator yielding encrypted data chunks
+        base_nonce: Base nonce the chunk nonces are derived from
+    
+    Yields:
+        Decrypted data chunks
+    """
+    index = 0
+    async for chunk in input_stream:
+        if len(chunk) == 0:
+            continue
         
-        yield decrypted_chunk
+        yield encryptor.decrypt_chunk(chunk, derive_chunk_nonce(base_nonce, index))
+        index += 1
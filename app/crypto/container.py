@@ -1,39 +1,98 @@
 """E4P container format implementation."""
 
-import json
+import base64
 import struct
-from datetime import datetime
+import time
+import zlib
+from datetime import datetime, timezone
 from typing import Dict, Any, Optional, Tuple
 from dataclasses import dataclass
+import orjson
 
 from app.config import settings
+from .aead import _NONCE_SIZES, get_nonce_size
 
 
-# E4P magic bytes
+# E4P magic bytes: E4P1 has a JSON header, E4P2 a binary one
 E4P_MAGIC = b"E4P1"
+E4P_MAGIC_V2 = b"E4P2"
 
+# E4P1: magic bytes followed by little-endian header length
+_PREFIX = struct.Struct('<4sI')
 
-@dataclass
+# E4P2 fixed fields: magic, algorithm, kdf, flags, salt length, nonce length,
+# kdf m/t/p, name length, original size, unix timestamp; followed by the
+# raw salt, raw nonce and UTF-8 original name
+_FIXED_V2 = struct.Struct('<4sBBBBBIIIHQQ')
+
+# E4P2 flag bits; with HEADER_CRC a CRC-32 of everything before it follows
+# the name, so a corrupted header is caught before key derivation
+_FLAG_HEADER_CRC = 0x01
+_KNOWN_FLAGS = _FLAG_HEADER_CRC
+_CRC = struct.Struct('<I')
+
+# Code 2 was written as XCHACHA20-POLY1305 but is actually libsodium's
+# secretbox; real XChaCha20-Poly1305 (IETF) files use code 3
+_ALGORITHM_CODES = {"AES-256-GCM": 1, "XSALSA20-POLY1305": 2, "XCHACHA20-POLY1305": 3}
+_ALGORITHM_NAMES = {code: name for name, code in _ALGORITHM_CODES.items()}
+_KDF_CODES = {"argon2id": 1}
+_KDF_NAMES = {code: name for name, code in _KDF_CODES.items()}
+
+# E4P1 files labelled XCHACHA20-POLY1305 were always secretbox
+_V1_ALGORITHMS = {"XCHACHA20-POLY1305": "XSALSA20-POLY1305"}
+_V1_LABELS = {name: label for label, name in _V1_ALGORITHMS.items()}
+
+# Shortest salt accepted when opening a file; new files use 32 bytes
+_MIN_SALT_LEN = 16
+
+# (second, RFC3339 string) for the most recent header timestamp
+_ts_cache: Tuple[int, str] = (0, "")
+
+
+def _format_timestamp(second: int) -> str:
+    """Format a unix timestamp as an RFC3339 UTC string."""
+    formatted = datetime.fromtimestamp(second, tz=timezone.utc).isoformat()
+    return formatted.replace("+00:00", "Z")
+
+
+def _parse_timestamp(timestamp: str) -> int:
+    """Parse an RFC3339 UTC string into a unix timestamp."""
+    parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def _utc_timestamp() -> str:
+    """Get the current UTC time as RFC3339, formatted at most once per second."""
+    global _ts_cache
+    second = int(time.time())
+    if second != _ts_cache[0]:
+        _ts_cache = (second, _format_timestamp(second))
+    return _ts_cache[1]
+
+
+@dataclass(slots=True)
 class E4PHeader:
     """E4P file header structure."""
     
     algorithm: str
     kdf: str
     kdf_params: Dict[str, int]
-    salt: str  # base64 encoded
-    nonce: str  # base64 encoded
+    salt: bytes
+    nonce: bytes
     original_name: str
     original_size: int
     timestamp: str  # RFC3339 format
     
     def to_dict(self) -> Dict[str, Any]:
-        """Convert header to dictionary."""
+        """Convert header to a JSON-ready dictionary with base64 salt and nonce."""
         return {
             "alg": self.algorithm,
             "kdf": self.kdf,
             "kdf_params": self.kdf_params,
-            "salt": self.salt,
-            "nonce": self.nonce,
+            "salt": base64.b64encode(self.salt).decode('ascii'),
+            "nonce": base64.b64encode(self.nonce).decode('ascii'),
             "orig_name": self.original_name,
             "orig_size": self.original_size,
             "ts": self.timestamp
@@ -41,13 +100,18 @@ class E4PHeader:
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "E4PHeader":
-        """Create header from dictionary."""
+        """
+        Create header from a dictionary produced by to_dict.
+        
+        Raises:
+            ValueError: If salt or nonce is not valid base64
+        """
         return cls(
             algorithm=data["alg"],
             kdf=data["kdf"],
             kdf_params=data["kdf_params"],
-            salt=data["salt"],
-            nonce=data["nonce"],
+            salt=base64.b64decode(data["salt"], validate=True),
+            nonce=base64.b64decode(data["nonce"], validate=True),
             original_name=data["orig_name"],
             original_size=data["orig_size"],
             timestamp=data["ts"]
@@ -59,7 +123,7 @@ class E4PContainer:
     
     def __init__(self, algorithm: str = "AES-256-GCM"):
         self.algorithm = algorithm
-        self.nonce_size = 12 if algorithm == "AES-256-GCM" else 24
+        self.nonce_size = _NONCE_SIZES.get(algorithm, 24)
     
     def create_header(
         self,
@@ -69,8 +133,6 @@ class E4PContainer:
         original_size: int
     ) -> E4PHeader:
         """Create a new E4P header."""
-        import base64
-        
         return E4PHeader(
             algorithm=self.algorithm,
             kdf="argon2id",
@@ -79,53 +141,136 @@ class E4PContainer:
                 "t": settings.argon2_time_cost,
                 "p": settings.argon2_parallelism
             },
-            salt=base64.b64encode(salt).decode('utf-8'),
-            nonce=base64.b64encode(nonce).decode('utf-8'),
+            salt=bytes(salt),
+            nonce=bytes(nonce),
             original_name=original_name,
             original_size=original_size,
-            timestamp=datetime.utcnow().isoformat() + "Z"
+            timestamp=_utc_timestamp()
         )
     
     def serialize_header(self, header: E4PHeader) -> bytes:
-        """Serialize header to bytes."""
-        # Convert header to JSON
-        header_json = json.dumps(header.to_dict(), separators=(',', ':')).encode('utf-8')
+        """Serialize header to bytes in the binary E4P2 layout."""
+        try:
+            algorithm = _ALGORITHM_CODES[header.algorithm]
+            kdf = _KDF_CODES[header.kdf]
+        except KeyError as e:
+            raise ValueError(f"Cannot serialize header: unknown {e}") from None
+        
+        salt = header.salt
+        nonce = header.nonce
+        name = header.original_name.encode('utf-8')
+        
+        # Fill one preallocated buffer: fixed fields, salt, nonce, name, CRC
+        buffer = bytearray(_FIXED_V2.size + len(salt) + len(nonce) + len(name) + _CRC.size)
+        _FIXED_V2.pack_into(
+            buffer, 0,
+            E4P_MAGIC_V2,
+            algorithm,
+            kdf,
+            _FLAG_HEADER_CRC,
+            len(salt),
+            len(nonce),
+            header.kdf_params["m"],
+            header.kdf_params["t"],
+            header.kdf_params["p"],
+            len(name),
+            header.original_size,
+            _parse_timestamp(header.timestamp)
+        )
+        offset = _FIXED_V2.size
+        for part in (salt, nonce, name):
+            buffer[offset:offset + len(part)] = part
+            offset += len(part)
+        _CRC.pack_into(buffer, offset, zlib.crc32(memoryview(buffer)[:offset]))
+        
+        return bytes(buffer)
+    
+    def serialize_header_v1(self, header: E4PHeader) -> bytes:
+        """Serialize header to bytes in the legacy JSON E4P1 layout."""
+        if header.algorithm in _V1_ALGORITHMS:
+            raise ValueError(f"{header.algorithm} cannot be stored in an E4P1 header")
+        
+        # Convert header to compact JSON, restoring the legacy algorithm label
+        header_dict = header.to_dict()
+        header_dict["alg"] = _V1_LABELS.get(header.algorithm, header.algorithm)
+        header_json = orjson.dumps(header_dict)
         header_len = len(header_json)
         
         # Create the complete header: magic + length + JSON
-        return E4P_MAGIC + struct.pack('<I', header_len) + header_json
+        return _PREFIX.pack(E4P_MAGIC, header_len) + header_json
     
     def deserialize_header(self, data: bytes) -> Tuple[E4PHeader, int]:
         """
         Deserialize header from bytes.
         
+        Both the binary E4P2 and the legacy JSON E4P1 layouts are accepted.
+        
         Returns:
             Tuple of (header, bytes_consumed)
         """
-        if len(data) < 8:  # magic + length
+        if data[:4] == E4P_MAGIC_V2:
+            return self._deserialize_header_v2(data)
+        
+        if len(data) < _PREFIX.size:  # magic + length
             raise ValueError("Invalid E4P file: too short")
         
-        # Check magic bytes
-        if data[:4] != E4P_MAGIC:
+        # Read magic bytes and header length in one unpack
+        magic, header_len = _PREFIX.unpack_from(data, 0)
+        if magic != E4P_MAGIC:
             raise ValueError("Invalid E4P file: wrong magic bytes")
         
-        # Read header length
-        header_len = struct.unpack('<I', data[4:8])[0]
-        
-        if len(data) < 8 + header_len:
+        header_end = _PREFIX.size + header_len
+        if len(data) < header_end:
             raise ValueError("Invalid E4P file: incomplete header")
         
-        # Parse header JSON
-        header_json = data[8:8 + header_len].decode('utf-8')
-        header_data = json.loads(header_json)
+        # Parse header JSON straight from bytes
+        header_data = orjson.loads(data[_PREFIX.size:header_end])
         
         header = E4PHeader.from_dict(header_data)
-        return header, 8 + header_len
+        header.algorithm = _V1_ALGORITHMS.get(header.algorithm, header.algorithm)
+        return header, header_end
+    
+    def _deserialize_header_v2(self, data: bytes) -> Tuple[E4PHeader, int]:
+        """Deserialize a binary E4P2 header."""
+        if len(data) < _FIXED_V2.size:
+            raise ValueError("Invalid E4P file: too short")
+        
+        (_, algorithm, kdf, flags, salt_len, nonce_len,
+         m, t, p, name_len, original_size, timestamp) = _FIXED_V2.unpack_from(data, 0)
+        
+        if algorithm not in _ALGORITHM_NAMES or kdf not in _KDF_NAMES:
+            raise ValueError("Invalid E4P file: unknown algorithm")
+        if flags & ~_KNOWN_FLAGS:
+            raise ValueError("Invalid E4P file: unsupported flags")
+        
+        salt_end = _FIXED_V2.size + salt_len
+        nonce_end = salt_end + nonce_len
+        name_end = nonce_end + name_len
+        header_end = name_end + (_CRC.size if flags & _FLAG_HEADER_CRC else 0)
+        if len(data) < header_end:
+            raise ValueError("Invalid E4P file: incomplete header")
+        
+        view = memoryview(data)
+        if flags & _FLAG_HEADER_CRC:
+            if zlib.crc32(view[:name_end]) != _CRC.unpack_from(data, name_end)[0]:
+                raise ValueError("Invalid E4P file: header checksum mismatch")
+        
+        header = E4PHeader(
+            algorithm=_ALGORITHM_NAMES[algorithm],
+            kdf=_KDF_NAMES[kdf],
+            kdf_params={"m": m, "t": t, "p": p},
+            salt=bytes(view[_FIXED_V2.size:salt_end]),
+            nonce=bytes(view[salt_end:nonce_end]),
+            original_name=str(view[nonce_end:name_end], 'utf-8'),
+            original_size=original_size,
+            timestamp=_format_timestamp(timestamp)
+        )
+        return header, header_end
     
     def validate_header(self, header: E4PHeader) -> bool:
         """Validate header structure and parameters."""
         # Check algorithm
-        if header.algorithm not in ["AES-256-GCM", "XCHACHA20-POLY1305"]:
+        if header.algorithm not in _NONCE_SIZES:
             return False
         
         # Check KDF
@@ -143,12 +288,9 @@ class E4PContainer:
             header.kdf_params["p"] < 1):
             return False
         
-        # Check salt and nonce are base64 encoded
-        try:
-            import base64
-            base64.b64decode(header.salt)
-            base64.b64decode(header.nonce)
-        except Exception:
+        # Check the salt is long enough and the nonce fits the algorithm,
+        # or every chunk would fail later
+        if len(header.salt) < _MIN_SALT_LEN or len(header.nonce) != _NONCE_SIZES[header.algorithm]:
             return False
         
         # Check original size is reasonable
@@ -157,11 +299,25 @@ class E4PContainer:
         
         return True
     
+    def validate_and_decode_header(
+        self,
+        header: E4PHeader
+    ) -> Tuple[bool, Optional[bytes], Optional[bytes]]:
+        """
+        Validate a header and return its salt and nonce.
+        
+        Args:
+            header: Parsed E4P header
+        
+        Returns:
+            Tuple of (valid, salt bytes, nonce bytes); the bytes are None
+            when the header is invalid
+        """
+        if not self.validate_header(header):
+            return False, None, None
+        
+        return True, header.salt, header.nonce
+    
     def get_expected_nonce_size(self, algorithm: str) -> int:
         """Get expected nonce size for algorithm."""
-        if algorithm == "AES-256-GCM":
-            return 12
-        elif algorithm == "XCHACHA20-POLY1305":
-            return 24
-        else:
-            raise ValueError(f"Unknown algorithm: {algorithm}")
+        return get_nonce_size(algorithm)
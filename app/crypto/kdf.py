@@ -1,13 +1,23 @@
 """Key derivation functions using Argon2id."""
 
+import asyncio
+import hmac
 import os
-from typing import Tuple
-from argon2 import PasswordHasher, Type
+from concurrent.futures import ThreadPoolExecutor
+from argon2.low_level import Type, hash_secret_raw
 from argon2.exceptions import HashingError
 
 from app.config import settings
 
 
+# Argon2id is memory-hard and slow by design; run it off the event loop.
+# libargon2 releases the GIL, so concurrent derivations run in parallel.
+_KDF_POOL = ThreadPoolExecutor(
+    max_workers=settings.max_concurrency,
+    thread_name_prefix="argon2"
+)
+
+
 def derive_key(password: str, salt: bytes) -> bytes:
     """
     Derive encryption key from password using Argon2id.
@@ -23,42 +33,36 @@ def derive_key(password: str, salt: bytes) -> bytes:
         HashingError: If key derivation fails
     """
     try:
-        # Convert memory cost from MB to KB
-        memory_cost = settings.argon2_memory_mb * 1024
-        
-        ph = PasswordHasher(
-            memory_cost=memory_cost,
+        # Get the raw hash directly instead of parsing the encoded PHC string
+        return hash_secret_raw(
+            password.encode('utf-8'),
+            salt,
             time_cost=settings.argon2_time_cost,
+            memory_cost=settings.argon2_memory_mb * 1024,  # Convert MB to KB
             parallelism=settings.argon2_parallelism,
             hash_len=settings.argon2_key_len,
             type=Type.ID
         )
         
-        # Hash the password with the salt
-        hash_result = ph.hash(password, salt=salt)
-        
-        # Extract the raw hash bytes from the encoded format
-        # The hash result contains the raw hash bytes after the encoded header
-        import base64
-        # Split by $ to get the parts: $argon2id$v=19$m=262144,t=3,p=2$salt$hash
-        parts = hash_result.split('$')
-        if len(parts) >= 6:
-            # The last part is the base64-encoded hash
-            hash_b64 = parts[-1]
-            # Add padding if needed
-            missing_padding = len(hash_b64) % 4
-            if missing_padding:
-                hash_b64 += '=' * (4 - missing_padding)
-            hash_bytes = base64.b64decode(hash_b64)
-            return hash_bytes[:settings.argon2_key_len]
-        else:
-            # Fallback: use the hash string as bytes
-            return hash_result.encode('utf-8')[:settings.argon2_key_len]
-        
     except HashingError as e:
         raise HashingError(f"Key derivation failed: {e}")
 
 
+async def aderive_key(password: str, salt: bytes) -> bytes:
+    """
+    Derive encryption key on the KDF thread pool without blocking the event loop.
+    
+    Args:
+        password: User-provided password
+        salt: Random salt bytes
+        
+    Returns:
+        Derived key bytes
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_KDF_POOL, derive_key, password, salt)
+
+
 def generate_salt() -> bytes:
     """Generate a cryptographically secure random salt."""
     return os.urandom(32)  # 32 bytes = 256 bits
@@ -78,6 +82,7 @@ def verify_key_derivation(password: str, salt: bytes, expected_key: bytes) -> bo
     """
     try:
         derived_key = derive_key(password, salt)
-        return derived_key == expected_key
+        # Constant-time comparison so timing does not leak matching bytes
+        return hmac.compare_digest(derived_key, expected_key)
     except HashingError:
         return False
@@ -0,0 +1,141 @@
+"""In-memory cache of derived keys for repeated decryptions."""
+
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.config import settings
+from .kdf import derive_key
+
+
+# Argon2id memory (KiB), time cost and parallelism
+_KDF_PARAMS = struct.Struct('<III')
+
+
+def _current_kdf_params() -> Dict[str, int]:
+    """Argon2id parameters derive_key uses with the current settings."""
+    return {
+        "m": settings.argon2_memory_mb * 1024,
+        "t": settings.argon2_time_cost,
+        "p": settings.argon2_parallelism
+    }
+
+
+class KeyCache:
+    """LRU cache of derived keys with a per-entry time-to-live."""
+    
+    def __init__(self, maxsize: int = 256, ttl: float = 600.0):
+        """
+        Initialize key cache.
+        
+        Args:
+            maxsize: Maximum number of cached keys
+            ttl: Seconds a cached key stays valid
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _cache_key(
+        password: str,
+        salt: bytes,
+        kdf_params: Optional[Dict[str, int]]
+    ) -> bytes:
+        """Digest the KDF inputs so the plaintext password is never stored."""
+        if kdf_params is None:
+            kdf_params = _current_kdf_params()
+        digest = hashlib.blake2b(digest_size=32)
+        digest.update(_KDF_PARAMS.pack(kdf_params["m"], kdf_params["t"], kdf_params["p"]))
+        digest.update(len(salt).to_bytes(4, 'little'))
+        digest.update(salt)
+        digest.update(password.encode('utf-8'))
+        return digest.digest()
+    
+    def get(
+        self,
+        password: str,
+        salt: bytes,
+        kdf_params: Optional[Dict[str, int]] = None
+    ) -> Optional[bytes]:
+        """
+        Look up a cached key.
+        
+        Args:
+            password: User-provided password
+            salt: Salt used for key derivation
+            kdf_params: Argon2id m/t/p from the header (current settings if omitted)
+        
+        Returns:
+            Cached key, or None if missing or expired
+        """
+        cache_key = self._cache_key(password, salt, kdf_params)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            
+            key, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[cache_key]
+                return None
+            
+            self._entries.move_to_end(cache_key)
+            return key
+    
+    def put(
+        self,
+        password: str,
+        salt: bytes,
+        key: bytes,
+        kdf_params: Optional[Dict[str, int]] = None
+    ) -> None:
+        """
+        Store a derived key.
+        
+        Args:
+            password: User-provided password
+            salt: Salt used for key derivation
+            key: Derived key bytes
+            kdf_params: Argon2id m/t/p from the header (current settings if omitted)
+        """
+        cache_key = self._cache_key(password, salt, kdf_params)
+        with self._lock:
+            self._entries[cache_key] = (key, time.monotonic() + self.ttl)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """Drop all cached keys."""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Global key cache instance
+key_cache = KeyCache()
+
+
+def derive_key_cached(password: str, salt: bytes) -> bytes:
+    """
+    Derive a key, reusing a cached result for the same password and salt.
+    
+    Args:
+        password: User-provided password
+        salt: Random salt bytes
+    
+    Returns:
+        Derived key bytes
+    """
+    key = key_cache.get(password, salt)
+    if key is None:
+        key = derive_key(password, salt)
+        key_cache.put(password, salt, key)
+    return key
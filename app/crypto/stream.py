@@ -1,46 +1,299 @@
 """Streaming encryption/decryption utilities."""
 
+import asyncio
+import mmap
 import os
 import aiofiles
-from typing import AsyncGenerator, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable, Dict, Tuple, Optional
 from pathlib import Path
 
-from .aead import create_encryptor, encrypt_stream, decrypt_stream
-from .kdf import derive_key, generate_salt
+from .aead import AEADEncryptor, create_encryptor, derive_chunk_nonces, get_nonce_size
+from .kdf import aderive_key, generate_salt
+from .kdf_cache import key_cache
 from .container import E4PContainer, E4PHeader
 
 
+# Chunks sealed/opened concurrently per file. The AEAD libraries release
+# the GIL inside OpenSSL/libsodium, so threads scale across cores.
+_CRYPTO_WORKERS = min(8, os.cpu_count() or 1)
+_CRYPTO_POOL = ThreadPoolExecutor(
+    max_workers=_CRYPTO_WORKERS,
+    thread_name_prefix="e4p-crypto"
+)
+
+
+def _preallocate(fd: int, size: int) -> bool:
+    """
+    Reserve disk space for a file up front so it is laid out contiguously.
+    
+    Args:
+        fd: Open file descriptor
+        size: Total file size in bytes
+    
+    Returns:
+        True if space was reserved, False if unsupported
+    """
+    if size <= 0 or not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, size)
+        return True
+    except OSError:
+        # Filesystem does not support preallocation
+        return False
+
+
+def _advise_sequential(fd: int) -> None:
+    """
+    Tell the kernel a file will be read front to back, widening readahead.
+    
+    Args:
+        fd: Open file descriptor
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    except OSError:
+        # Hints are best effort
+        pass
+
+
+def _seal_mapped(
+    transform: Callable[[memoryview, bytes], bytes],
+    path: Path,
+    size: int,
+    nonce: bytes
+) -> bytes:
+    """
+    Encrypt a whole file in one AEAD call by memory-mapping it.
+    
+    Args:
+        transform: encrypt_chunk of an encryptor
+        path: Path to input file
+        size: Number of bytes to map (the size recorded in the header)
+        nonce: Nonce for the single chunk
+    
+    Returns:
+        Encrypted chunk
+    """
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) as mapped:
+            return transform(mapped, nonce)
+
+
+def _cache_key_on_success(
+    transform: Callable[[memoryview, bytes], bytes],
+    password: str,
+    salt: bytes,
+    kdf_params: Dict[str, int],
+    key: bytes
+) -> Callable[[memoryview, bytes], bytes]:
+    """
+    Wrap a decrypt transform so its key is cached once a chunk authenticates.
+    
+    Args:
+        transform: decrypt_chunk of an encryptor built from key
+        password: User password the key was derived from
+        salt: Salt the key was derived with
+        kdf_params: Argon2id parameters from the header
+        key: Derived key
+    
+    Returns:
+        Transform with the same signature
+    """
+    cached = False
+    
+    def decrypt(chunk: memoryview, nonce: bytes) -> bytes:
+        nonlocal cached
+        plaintext = transform(chunk, nonce)
+        if not cached:
+            cached = True
+            key_cache.put(password, salt, key, kdf_params)
+        return plaintext
+    
+    return decrypt
+
+
 class StreamProcessor:
     """Handles streaming encryption and decryption operations."""
     
     def __init__(self, chunk_size: int = 1024 * 1024):  # 1MB chunks
         self.chunk_size = chunk_size
     
-    async def encrypt_file(
+    async def _read_ahead(
+        self,
+        file,
+        size: int,
+        depth: int = 2,
+        held: int = 1
+    ) -> AsyncGenerator[memoryview, None]:
+        """
+        Read fixed-size chunks from an open file, prefetching in the background.
+        
+        A producer task keeps up to `depth` chunks queued so disk reads overlap
+        with the encryption/decryption done by the consumer. Chunks are read
+        into a small ring of reused buffers and yielded as memoryviews, so a
+        chunk is only valid until the consumer has taken `held` more.
+        
+        Args:
+            file: Open aiofiles file object
+            size: Chunk size in bytes
+            depth: Maximum number of chunks read ahead
+            held: Maximum number of chunks the consumer keeps at once
+        
+        Yields:
+            Data chunks until end of file
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        stopping = False
+        
+        # One buffer per chunk that can be alive at once: held by the
+        # consumer, queued, or being filled by the producer
+        ring: list = [None] * (depth + held + 1)
+        
+        async def producer():
+            slot = 0
+            try:
+                while not stopping:
+                    if ring[slot] is None:
+                        ring[slot] = bytearray(size)
+                    buffer = ring[slot]
+                    slot = (slot + 1) % len(ring)
+                    
+                    count = await file.readinto(buffer)
+                    if stopping:
+                        break
+                    await queue.put(memoryview(buffer)[:count])
+                    if not count:
+                        break
+            except Exception as e:
+                await queue.put(e)
+        
+        task = asyncio.create_task(producer())
+        try:
+            while True:
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                if not item:
+                    break
+                yield item
+        finally:
+            # Let the producer finish its in-flight read before the file closes
+            stopping = True
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.gather(task, return_exceptions=True)
+    
+    async def _transform_stream(
+        self,
+        chunks: AsyncGenerator[memoryview, None],
+        transform: Callable[[memoryview, bytes], bytes],
+        base_nonce: bytes
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Apply an AEAD transform to chunks in parallel and yield results in order.
+        
+        Args:
+            chunks: Async generator yielding input chunks; each batch is
+                finished before more chunks are taken
+            transform: encrypt_chunk or decrypt_chunk of an encryptor
+            base_nonce: Base nonce the chunk nonces are derived from
+        
+        Yields:
+            Transformed chunks
+        """
+        run_in_executor = asyncio.get_running_loop().run_in_executor
+        index = 0
+        batch = []
+        
+        async def run():
+            nonlocal index
+            nonces = derive_chunk_nonces(base_nonce, index, len(batch))
+            results = await asyncio.gather(*[
+                run_in_executor(_CRYPTO_POOL, transform, chunk, nonce)
+                for chunk, nonce in zip(batch, nonces)
+            ])
+            index += len(batch)
+            batch.clear()
+            return results
+        
+        async for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) == _CRYPTO_WORKERS:
+                for result in await run():
+                    yield result
+        if batch:
+            for result in await run():
+                yield result
+    
+    async def _transform_chunks(
+        self,
+        chunks: AsyncGenerator[memoryview, None],
+        transform: Callable[[memoryview, bytes], bytes],
+        base_nonce: bytes,
+        out_file
+    ) -> int:
+        """
+        Apply an AEAD transform to chunks in parallel and write results in order.
+        
+        Args:
+            chunks: Async generator yielding input chunks; each batch is
+                finished before more chunks are taken
+            transform: encrypt_chunk or decrypt_chunk of an encryptor
+            base_nonce: Base nonce the chunk nonces are derived from
+            out_file: Open aiofiles file object to write results to
+        
+        Returns:
+            Number of bytes written
+        """
+        written = 0
+        results = self._transform_stream(chunks, transform, base_nonce)
+        async with aclosing(results):
+            async for result in results:
+                await out_file.write(result)
+                written += len(result)
+        
+        return written
+    
+    async def _prepare_encryption(
         self,
         input_path: Path,
-        output_path: Path,
         password: str,
-        algorithm: str = "AES-256-GCM"
-    ) -> E4PHeader:
+        algorithm: str,
+        salt: Optional[bytes],
+        key: Optional[bytes],
+        original_name: Optional[str]
+    ) -> Tuple[E4PHeader, bytes, AEADEncryptor, bytes, int]:
         """
-        Encrypt a file using streaming approach.
+        Set up everything needed to encrypt a file.
         
         Args:
             input_path: Path to input file
-            output_path: Path to output encrypted file
             password: User password
             algorithm: Encryption algorithm
-            
+            salt: Salt to record in the header (random if omitted)
+            key: Key already derived from password and salt, to skip Argon2id
+            original_name: Name to record in the header (input file name if omitted)
+        
         Returns:
-            E4P header with metadata
+            Tuple of (header, serialized header, encryptor, base nonce,
+            total encrypted size)
         """
-        # Generate random salt and nonce
-        salt = generate_salt()
-        nonce = os.urandom(12 if algorithm == "AES-256-GCM" else 24)
+        if key is not None and salt is None:
+            raise ValueError("A precomputed key requires the salt it was derived with")
+        
+        # Generate random salt and nonce; the nonce is always fresh per file
+        if salt is None:
+            salt = generate_salt()
+        nonce = os.urandom(get_nonce_size(algorithm))
         
         # Derive key from password
-        key = derive_key(password, salt)
+        if key is None:
+            key = await aderive_key(password, salt)
         
         # Create encryptor
         encryptor = create_encryptor(algorithm, key)
@@ -49,32 +302,160 @@ class StreamProcessor:
         container = E4PContainer(algorithm)
         
         # Create header
+        original_size = input_path.stat().st_size
         header = container.create_header(
             salt=salt,
             nonce=nonce,
-            original_name=input_path.name,
-            original_size=input_path.stat().st_size
+            original_name=input_path.name if original_name is None else original_name,
+            original_size=original_size
         )
         
         # Serialize header
         header_bytes = container.serialize_header(header)
         
+        # Final size is known up front: header + plaintext + per-chunk overhead
+        num_chunks = -(-original_size // self.chunk_size)
+        total_size = len(header_bytes) + original_size + num_chunks * encryptor.overhead
+        
+        return header, header_bytes, encryptor, nonce, total_size
+    
+    async def encrypt_file(
+        self,
+        input_path: Path,
+        output_path: Path,
+        password: str,
+        algorithm: str = "AES-256-GCM",
+        salt: Optional[bytes] = None,
+        key: Optional[bytes] = None,
+        original_name: Optional[str] = None
+    ) -> E4PHeader:
+        """
+        Encrypt a file using streaming approach.
+        
+        Args:
+            input_path: Path to input file
+            output_path: Path to output encrypted file
+            password: User password
+            algorithm: Encryption algorithm
+            salt: Salt to record in the header (random if omitted)
+            key: Key already derived from password and salt, to skip Argon2id
+            original_name: Name to record in the header (input file name if omitted)
+        
+        Returns:
+            E4P header with metadata
+        """
+        header, _ = await self.encrypt_file_with_size(
+            input_path, output_path, password, algorithm, salt, key, original_name
+        )
+        return header
+    
+    async def encrypt_file_with_size(
+        self,
+        input_path: Path,
+        output_path: Path,
+        password: str,
+        algorithm: str = "AES-256-GCM",
+        salt: Optional[bytes] = None,
+        key: Optional[bytes] = None,
+        original_name: Optional[str] = None
+    ) -> Tuple[E4PHeader, int]:
+        """
+        Encrypt a file and report the size of the written container.
+        
+        Args:
+            input_path: Path to input file
+            output_path: Path to output encrypted file
+            password: User password
+            algorithm: Encryption algorithm
+            salt: Salt to record in the header (random if omitted)
+            key: Key already derived from password and salt, to skip Argon2id
+            original_name: Name to record in the header (input file name if omitted)
+        
+        Returns:
+            Tuple of (E4P header, encrypted file size in bytes)
+        """
+        header, header_bytes, encryptor, nonce, total_size = await self._prepare_encryption(
+            input_path, password, algorithm, salt, key, original_name
+        )
+        
+        loop = asyncio.get_running_loop()
+        
+        # A file that fits in one chunk is sealed in a single call on a
+        # mapping of the input, skipping the read-ahead pipeline
+        if 0 < header.original_size <= self.chunk_size:
+            ciphertext = await loop.run_in_executor(
+                _CRYPTO_POOL, _seal_mapped,
+                encryptor.encrypt_chunk, input_path, header.original_size, nonce
+            )
+            async with aiofiles.open(output_path, 'wb') as out_file:
+                await out_file.write(header_bytes)
+                await out_file.write(ciphertext)
+            return header, len(header_bytes) + len(ciphertext)
+        
         # Write header to output file
         async with aiofiles.open(output_path, 'wb') as out_file:
+            preallocated = await loop.run_in_executor(
+                None, _preallocate, out_file.fileno(), total_size
+            )
+            
             await out_file.write(header_bytes)
             
             # Encrypt and write file content
             async with aiofiles.open(input_path, 'rb') as in_file:
-                while True:
-                    chunk = await in_file.read(self.chunk_size)
-                    if not chunk:
-                        break
-                    
-                    # Encrypt chunk
-                    encrypted_chunk = encryptor.encrypt_chunk(chunk, nonce)
-                    await out_file.write(encrypted_chunk)
+                _advise_sequential(in_file.fileno())
+                chunks = self._read_ahead(
+                    in_file, self.chunk_size, depth=_CRYPTO_WORKERS, held=_CRYPTO_WORKERS
+                )
+                async with aclosing(chunks):
+                    written = await self._transform_chunks(
+                        chunks, encryptor.encrypt_chunk, nonce, out_file
+                    )
+            
+            # Drop any reserved tail if the input shrank while reading
+            if preallocated:
+                await out_file.truncate()
         
-        return header
+        # Counted while writing, so no stat of the output is needed
+        return header, len(header_bytes) + written
+    
+    async def encrypt_to_stream(
+        self,
+        input_path: Path,
+        password: str,
+        algorithm: str = "AES-256-GCM",
+        original_name: Optional[str] = None
+    ) -> Tuple[E4PHeader, int, AsyncGenerator[bytes, None]]:
+        """
+        Encrypt a file without writing the ciphertext to disk.
+        
+        Args:
+            input_path: Path to input file
+            password: User password
+            algorithm: Encryption algorithm
+            original_name: Name to record in the header (input file name if omitted)
+        
+        Returns:
+            Tuple of (header, total encrypted size, async generator yielding
+            the encrypted file from the header onwards)
+        """
+        header, header_bytes, encryptor, nonce, total_size = await self._prepare_encryption(
+            input_path, password, algorithm, None, None, original_name
+        )
+        
+        async def body() -> AsyncGenerator[bytes, None]:
+            yield header_bytes
+            async with aiofiles.open(input_path, 'rb') as in_file:
+                _advise_sequential(in_file.fileno())
+                chunks = self._read_ahead(
+                    in_file, self.chunk_size, depth=_CRYPTO_WORKERS, held=_CRYPTO_WORKERS
+                )
+                async with aclosing(chunks):
+                    results = self._transform_stream(chunks, encryptor.encrypt_chunk, nonce)
+                    async with aclosing(results):
+                        async for result in results:
+                            yield result
+        
+        return header, total_size, body()
     
     async def decrypt_file(
         self,
@@ -89,73 +470,136 @@ class StreamProcessor:
             input_path: Path to encrypted E4P file
             output_path: Path to output decrypted file
             password: User password
-            
+        
+        Returns:
+            True if decryption successful, False otherwise
+        """
+        parsed = await self.get_header(input_path)
+        if parsed is None:
+            return False
+        
+        header, header_offset = parsed
+        return await self.decrypt_file_with_header(
+            input_path, output_path, password, header, header_offset
+        )
+    
+    async def decrypt_file_with_header(
+        self,
+        input_path: Path,
+        output_path: Path,
+        password: str,
+        header: E4PHeader,
+        header_offset: int
+    ) -> bool:
+        """
+        Decrypt an E4P file whose header has already been parsed.
+        
+        Args:
+            input_path: Path to encrypted E4P file
+            output_path: Path to output decrypted file
+            password: User password
+            header: Header returned by get_header
+            header_offset: Offset of the encrypted data returned by get_header
+        
         Returns:
             True if decryption successful, False otherwise
         """
         try:
-            # Read and parse header
+            # Validate header and decode salt and nonce once
+            valid, salt, nonce = E4PContainer().validate_and_decode_header(header)
+            if not valid:
+                return False
+            
+            # Reuse the key when the same file is retried; a new key is only
+            # cached once it has opened a chunk, so wrong passwords are not kept
+            key = key_cache.get(password, salt, header.kdf_params)
+            derived = key is None
+            if derived:
+                key = await aderive_key(password, salt)
+            
+            # Create decryptor
+            encryptor = create_encryptor(header.algorithm, key)
+            
+            # Each encrypted chunk carries the AEAD overhead
+            overhead = encryptor.overhead
+            transform = encryptor.decrypt_chunk
+            
             async with aiofiles.open(input_path, 'rb') as file:
-                # Read enough data for header
-                header_data = await file.read(8192)  # Read first 8KB
+                _advise_sequential(file.fileno())
                 
-                container = E4PContainer()
-                header, header_offset = container.deserialize_header(header_data)
-                
-                # Validate header
-                if not container.validate_header(header):
-                    return False
-                
-                # Decode salt and nonce
-                import base64
-                salt = base64.b64decode(header.salt)
-                nonce = base64.b64decode(header.nonce)
+                # Older XChaCha20 files repeat the chunk nonce in front of each
+                # chunk; the first chunk then starts with the header nonce
+                if hasattr(encryptor, "decrypt_legacy_chunk"):
+                    await file.seek(header_offset)
+                    if await file.read(len(nonce)) == nonce:
+                        overhead = encryptor.legacy_overhead
+                        transform = encryptor.decrypt_legacy_chunk
                 
-                # Derive key
-                key = derive_key(password, salt)
-                
-                # Create decryptor
-                encryptor = create_encryptor(header.algorithm, key)
+                if derived:
+                    transform = _cache_key_on_success(
+                        transform, password, salt, header.kdf_params, key
+                    )
                 
                 # Seek to start of encrypted data
                 await file.seek(header_offset)
                 
+                encrypted_chunk_size = self.chunk_size + overhead
+                
                 # Decrypt and write file content
                 async with aiofiles.open(output_path, 'wb') as out_file:
-                    while True:
-                        chunk = await file.read(self.chunk_size)
-                        if not chunk:
-                            break
-                        
-                        # Decrypt chunk
-                        decrypted_chunk = encryptor.decrypt_chunk(chunk, nonce)
-                        await out_file.write(decrypted_chunk)
+                    chunks = self._read_ahead(
+                        file, encrypted_chunk_size, depth=_CRYPTO_WORKERS, held=_CRYPTO_WORKERS
+                    )
+                    async with aclosing(chunks):
+                        total_size = await self._transform_chunks(
+                            chunks, transform, nonce, out_file
+                        )
+                
+                # Detect truncation at a chunk boundary
+                if total_size != header.original_size:
+                    raise ValueError("Decrypted size does not match header")
             
             return True
-            
+        
         except Exception:
+            # Do not leave partial plaintext behind
+            if output_path.exists():
+                output_path.unlink()
             return False
     
-    async def get_file_info(self, input_path: Path) -> Optional[E4PHeader]:
+    async def get_header(self, input_path: Path) -> Optional[Tuple[E4PHeader, int]]:
         """
-        Get file information from E4P header without decryption.
+        Read and validate the header of an E4P file.
         
         Args:
             input_path: Path to E4P file
-            
+        
         Returns:
-            E4P header or None if invalid
+            Tuple of (header, offset of encrypted data) or None if invalid
         """
         try:
             async with aiofiles.open(input_path, 'rb') as file:
                 header_data = await file.read(8192)
                 
                 container = E4PContainer()
-                header, _ = container.deserialize_header(header_data)
+                header, header_offset = container.deserialize_header(header_data)
                 
                 if container.validate_header(header):
-                    return header
+                    return header, header_offset
                 return None
-                
+        
         except Exception:
             return None
+    
+    async def get_file_info(self, input_path: Path) -> Optional[E4PHeader]:
+        """
+        Get file information from E4P header without decryption.
+        
+        Args:
+            input_path: Path to E4P file
+        
+        Returns:
+            E4P header or None if invalid
+        """
+        parsed = await self.get_header(input_path)
+        return parsed[0] if parsed else None
@@ -0,0 +1,46 @@
+"""Shared service instances injected into routes with FastAPI Depends."""
+
+from functools import lru_cache
+
+from app.config import settings
+from app.crypto.stream import StreamProcessor
+from app.services.storage import StorageManager
+from app.services.tasks import TaskManager
+from app.services.tokens import TokenManager
+
+
+# Each factory builds its instance once. The managers start background
+# tasks, so the app lifespan calls them first, inside the running loop.
+
+@lru_cache(maxsize=None)
+def get_storage() -> StorageManager:
+    """Get the shared storage manager."""
+    return StorageManager()
+
+
+@lru_cache(maxsize=None)
+def get_tokens() -> TokenManager:
+    """Get the shared token manager."""
+    return TokenManager()
+
+
+@lru_cache(maxsize=None)
+def get_processor() -> StreamProcessor:
+    """Get the shared stream processor."""
+    return StreamProcessor()
+
+
+@lru_cache(maxsize=None)
+def get_task_manager() -> TaskManager:
+    """Get the shared task manager."""
+    return TaskManager(
+        settings.max_concurrency,
+        token_manager=get_tokens(),
+        processor=get_processor()
+    )
+
+
+def reset_dependencies() -> None:
+    """Forget all shared instances so the next lifespan builds fresh ones."""
+    for factory in (get_storage, get_tokens, get_processor, get_task_manager):
+        factory.cache_clear()
@@ -6,19 +6,65 @@ from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager
+import logging
 import os
 from pathlib import Path
 
 from app.config import settings
+from app.crypto.kdf_cache import key_cache
+from app.dependencies import get_storage, get_task_manager, reset_dependencies
 from app.routes import encrypt, decrypt, download
 
+logger = logging.getLogger("e4p")
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Attach a stderr handler to the e4p logger, once."""
+    if logger.handlers:
+        return
+    
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared services on startup and shut the same ones down on exit."""
+    # Ensure temp directory exists
+    os.makedirs(settings.temp_dir, exist_ok=True)
+    
+    # Build the managers inside the running loop; they start background tasks
+    storage_manager = get_storage()
+    task_manager = get_task_manager()
+    
+    logger.info("E4P application started on %s:%s", settings.app_host, settings.app_port)
+    logger.info("Temp directory: %s", settings.temp_dir)
+    logger.info("Max file size: %sMB", settings.max_file_size_mb)
+    
+    yield
+    
+    # Cleanup resources
+    await task_manager.shutdown()
+    await storage_manager.shutdown()
+    key_cache.clear()
+    reset_dependencies()
+    logger.info("E4P application shutdown complete")
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Encryption 4 People (E4P)",
     description="Secure file encryption web application",
     version="1.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -81,32 +127,6 @@ async def health_check():
     }
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Application startup event."""
-    # Ensure temp directory exists
-    os.makedirs(settings.temp_dir, exist_ok=True)
-    print(f"E4P application started on {settings.app_host}:{settings.app_port}")
-    print(f"Temp directory: {settings.temp_dir}")
-    print(f"Max file size: {settings.max_file_size_mb}MB")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Application shutdown event."""
-    # Cleanup resources
-    from app.services.tasks import TaskManager
-    from app.services.storage import StorageManager
-    
-    # Create instances for cleanup
-    task_manager = TaskManager()
-    storage_manager = StorageManager()
-    
-    await task_manager.shutdown()
-    await storage_manager.shutdown()
-    print("E4P application shutdown complete")
-
-
 if __name__ == "__main__":
     import uvicorn
     
@@ -116,5 +136,5 @@ if __name__ == "__main__":
         "app.main:app",
         host=settings.app_host,
         port=settings.app_port,
-        reload=True
+        reload=settings.debug
     )
@@ -1,25 +1,24 @@
 """Decryption API endpoints."""
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from fastapi.responses import JSONResponse
 from pathlib import Path
 
 from app.services.storage import StorageManager
 from app.services.tokens import TokenManager
 from app.crypto.stream import StreamProcessor
+from app.dependencies import get_processor, get_storage, get_tokens
 
 router = APIRouter()
 
-# Global instances
-storage_manager = StorageManager()
-token_manager = TokenManager()
-processor = StreamProcessor()
-
 
 @router.post("/api/decrypt")
 async def decrypt_file(
     file: UploadFile = File(...),
-    password: str = Form(...)
+    password: str = Form(...),
+    storage_manager: StorageManager = Depends(get_storage),
+    token_manager: TokenManager = Depends(get_tokens),
+    processor: StreamProcessor = Depends(get_processor)
 ):
     """
     Decrypt an E4P file.
@@ -46,19 +45,19 @@ async def decrypt_file(
         )
     
     try:
-        # Save uploaded file
-        content = await file.read()
-        temp_path = await storage_manager.save_uploaded_file(content, file.filename)
+        # Stream uploaded file to disk without buffering it whole
+        temp_path = await storage_manager.save_upload_stream(file, file.filename)
         
-        # Get file info from header
-        file_info = await processor.get_file_info(temp_path)
+        # Parse the header once and hand it to the decryptor
+        parsed = await processor.get_header(temp_path)
         
-        if not file_info:
+        if not parsed:
             await storage_manager.delete_file(temp_path)
             raise HTTPException(
                 status_code=400,
                 detail="Invalid E4P file format"
             )
+        file_info, header_offset = parsed
         
         # Create decrypted file path
         original_name = file_info.original_name
@@ -68,10 +67,12 @@ async def decrypt_file(
         )
         
         # Decrypt the file
-        success = await processor.decrypt_file(
+        success = await processor.decrypt_file_with_header(
             input_path=temp_path,
             output_path=decrypted_path,
-            password=password
+            password=password,
+            header=file_info,
+            header_offset=header_offset
         )
         
         if not success:
@@ -115,7 +116,11 @@ async def decrypt_file(
 
 
 @router.get("/api/file-info")
-async def get_file_info(file: UploadFile = File(...)):
+async def get_file_info(
+    file: UploadFile = File(...),
+    storage_manager: StorageManager = Depends(get_storage),
+    processor: StreamProcessor = Depends(get_processor)
+):
     """
     Get information about an E4P file without decryption.
     
@@ -132,9 +137,8 @@ async def get_file_info(file: UploadFile = File(...)):
         )
     
     try:
-        # Save uploaded file temporarily
-        content = await file.read()
-        temp_path = await storage_manager.save_uploaded_file(content, file.filename)
+        # Stream uploaded file to disk temporarily
+        temp_path = await storage_manager.save_upload_stream(file, file.filename)
         
         # Get file info
         file_info = await processor.get_file_info(temp_path)
@@ -1,26 +1,52 @@
 """Encryption API endpoints."""
 
+from contextlib import aclosing
+from pathlib import Path
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-from fastapi.responses import JSONResponse
-from typing import List
-import aiofiles
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import AsyncGenerator, List
 
-from app.services.tasks import TaskManager
-from app.services.storage import StorageManager
+from app.services.tasks import TaskManager, TaskStoreFullError
+from app.services.storage import StorageManager, UploadTooLargeError
+from app.crypto.stream import StreamProcessor
 from app.config import settings
+from app.dependencies import get_processor, get_storage, get_task_manager
+from app.routes.download import content_disposition
 
 router = APIRouter()
 
-# Global instances
-task_manager = TaskManager(settings.max_concurrency)
-storage_manager = StorageManager()
+
+async def _stream_then_delete(
+    body: AsyncGenerator[bytes, None],
+    temp_path: Path
+) -> AsyncGenerator[bytes, None]:
+    """
+    Relay an encrypted stream and delete the plaintext upload afterwards.
+    
+    Args:
+        body: Async generator yielding the encrypted file
+        temp_path: Plaintext upload to delete once streaming stops
+    
+    Yields:
+        Encrypted chunks
+    """
+    try:
+        async with aclosing(body):
+            async for chunk in body:
+                yield chunk
+    finally:
+        # Runs on success, on errors and when a disconnect closes the stream.
+        # Unlink directly: an await here could be cancelled with the response
+        temp_path.unlink(missing_ok=True)
 
 
 @router.post("/api/encrypt")
 async def encrypt_files(
     files: List[UploadFile] = File(...),
     password: str = Form(...),
-    algorithm: str = Form(default="AES-256-GCM")
+    algorithm: str = Form(default="AES-256-GCM"),
+    storage_manager: StorageManager = Depends(get_storage),
+    task_manager: TaskManager = Depends(get_task_manager)
 ):
     """
     Encrypt uploaded files.
@@ -60,89 +86,176 @@ async def encrypt_files(
             detail="Too many files. Maximum 10 files allowed"
         )
     
-    try:
-        file_list = []
-        
-        for file in files:
-            # Validate file size
-            if file.size > settings.max_file_size_mb * 1024 * 1024:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"File {file.filename} is too large. Maximum size is {settings.max_file_size_mb}MB"
-                )
+    file_list: list[dict] = []
+    errors: list[dict] = []
+    too_large = None
+    max_size = settings.max_file_size_mb * 1024 * 1024
+    
+    for file in files:
+        # Save uploaded file, enforcing the size limit while streaming
+        try:
+            temp_path = await storage_manager.save_upload_stream(
+                file, file.filename, max_size=max_size
+            )
+            
+            # Create encrypted file path
+            encrypted_path = storage_manager.create_temp_file(
+                file.filename,
+                suffix=".e4p"
+            )
+            
+            file_info = {
+                # Recorded in the header; the temp file names carry a random part
+                "original_name": storage_manager.sanitize_filename(file.filename),
+                "temp_path": str(temp_path),
+                "encrypted_path": str(encrypted_path),
+                "size": file.size
+            }
             
-            # Save uploaded file
-            try:
-                content = await file.read()
-                temp_path = await storage_manager.save_uploaded_file(content, file.filename)
-                
-                # Create encrypted file path
-                encrypted_path = storage_manager.create_temp_file(
-                    file.filename,
-                    suffix=".e4p"
-                )
-                
-                file_info = {
-                    "original_name": file.filename,
-                    "temp_path": str(temp_path),
-                    "encrypted_path": str(encrypted_path),
-                    "size": file.size
-                }
-                
-                file_list.append(file_info)
-            except Exception as e:
-                print(f"Error processing file {file.filename}: {e}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error processing file {file.filename}: {str(e)}"
-                )
+            file_list.append(file_info)
+        except UploadTooLargeError:
+            too_large = file.filename
+            break
+        except Exception as e:
+            errors.append({"original_name": file.filename, "error": str(e)})
+    
+    if too_large is not None or errors:
+        # Do not keep files saved before or after the failing ones
+        await storage_manager.cleanup_task_files(file_list)
+        
+        if too_large is not None:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File {too_large} is too large. Maximum size is {settings.max_file_size_mb}MB"
+            )
         
+        raise HTTPException(
+            status_code=500,
+            detail={"errors": errors}
+        )
+    
+    try:
         # Create encryption task
         task_id = await task_manager.create_task(
             files=file_list,
             password=password,
             algorithm=algorithm
         )
+    except TaskStoreFullError:
+        await storage_manager.cleanup_task_files(file_list)
         
-        return JSONResponse({
-            "task_id": task_id,
-            "files": [
-                {
-                    "original_name": f["original_name"],
-                    "size": f["size"]
-                }
-                for f in file_list
-            ],
-            "algorithm": algorithm,
-            "status": "pending"
-        })
-        
-    except HTTPException:
-        raise
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please try again later"
+        )
     except Exception as e:
-        print(f"Encryption error: {e}")
-        import traceback
-        traceback.print_exc()
-        
         # Clean up any saved files on error
-        for file_info in file_list:
-            if "temp_path" in file_info:
-                await storage_manager.delete_file(file_info["temp_path"])
+        await storage_manager.cleanup_task_files(file_list)
+        
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error during encryption: {str(e)}"
+        )
+    
+    return JSONResponse({
+        "task_id": task_id,
+        "files": [
+            {
+                "original_name": f["original_name"],
+                "size": f["size"]
+            }
+            for f in file_list
+        ],
+        "algorithm": algorithm,
+        "status": "pending"
+    })
+
+
+@router.post("/api/encrypt-stream")
+async def encrypt_file_stream(
+    file: UploadFile = File(...),
+    password: str = Form(...),
+    algorithm: str = Form(default="AES-256-GCM"),
+    storage_manager: StorageManager = Depends(get_storage),
+    processor: StreamProcessor = Depends(get_processor)
+):
+    """
+    Encrypt a single file and stream the E4P result back immediately.
+    
+    The ciphertext goes straight to the response instead of being written
+    to disk and read back by a later download.
+    
+    Args:
+        file: Uploaded file
+        password: User password
+        algorithm: Encryption algorithm (AES-256-GCM or XCHACHA20-POLY1305)
+    
+    Returns:
+        Streaming E4P file download response
+    """
+    # Validate algorithm
+    if algorithm not in ["AES-256-GCM", "XCHACHA20-POLY1305"]:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid algorithm. Must be AES-256-GCM or XCHACHA20-POLY1305"
+        )
+    
+    # Validate password
+    if not password or len(password) < 1:
+        raise HTTPException(
+            status_code=400,
+            detail="Password is required"
+        )
+    
+    try:
+        # Stream uploaded file to disk, enforcing the size limit as it arrives
+        temp_path = await storage_manager.save_upload_stream(
+            file, file.filename, max_size=settings.max_file_size_mb * 1024 * 1024
+        )
+        
+        header, total_size, body = await processor.encrypt_to_stream(
+            input_path=temp_path,
+            password=password,
+            algorithm=algorithm,
+            original_name=storage_manager.sanitize_filename(file.filename)
+        )
+    
+    except UploadTooLargeError:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File {file.filename} is too large. Maximum size is {settings.max_file_size_mb}MB"
+        )
+    except Exception as e:
+        if 'temp_path' in locals():
+            await storage_manager.delete_file(temp_path)
         
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error during encryption: {str(e)}"
         )
+    
+    # The plaintext copy is removed however the stream ends
+    return StreamingResponse(
+        _stream_then_delete(body, temp_path),
+        media_type='application/octet-stream',
+        headers={
+            'Content-Disposition': content_disposition(header.original_name + ".e4p"),
+            'Content-Length': str(total_size)
+        }
+    )
 
 
 @router.get("/api/status/{task_id}")
-async def get_task_status(task_id: str):
+async def get_task_status(
+    task_id: str,
+    task_manager: TaskManager = Depends(get_task_manager)
+):
     """
     Get encryption task status.
     
     Args:
         task_id: Task ID
-        
+    
     Returns:
         Task status information
     """
@@ -158,13 +271,17 @@ async def get_task_status(task_id: str):
 
 
 @router.delete("/api/task/{task_id}")
-async def cancel_task(task_id: str):
+async def cancel_task(
+    task_id: str,
+    task_manager: TaskManager = Depends(get_task_manager),
+    storage_manager: StorageManager = Depends(get_storage)
+):
     """
     Cancel an encryption task.
     
     Args:
         task_id: Task ID
-        
+    
     Returns:
         Success message
     """
@@ -176,16 +293,14 @@ async def cancel_task(task_id: str):
             detail="Task not found"
         )
     
-    if task.status.value in ["completed", "failed"]:
+    if task_manager.is_finished(task_id):
         raise HTTPException(
             status_code=400,
             detail="Cannot cancel completed or failed task"
         )
     
     # Mark task as failed
-    from app.services.tasks import TaskStatus
-    task.status = TaskStatus.FAILED
-    task.error_message = "Task cancelled by user"
+    task_manager.fail_task(task_id, "Task cancelled by user")
     
     # Clean up files
     await storage_manager.cleanup_task_files(task.files)
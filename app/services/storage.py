@@ -1,22 +1,82 @@
 """File storage and cleanup management."""
 
 import asyncio
+import logging
 import os
 import shutil
-from datetime import datetime, timedelta
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import List, Optional
 import aiofiles
+from fastapi import UploadFile
 
 from app.config import settings
 
 
+logger = logging.getLogger("e4p.storage")
+
+# Uploads are copied to disk in 1 MiB pieces
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Characters replaced with '_' in stored filenames
+_SANITIZE_TABLE = str.maketrans({c: '_' for c in '<>:"/\\|?*'})
+
+_MAX_NAME_LEN = 255
+
+# Separator plus the random characters mkstemp inserts
+_RANDOM_PART_LEN = 9
+
+
+def _fadvise(fd: int, advice: str) -> None:
+    """Pass a page cache hint for a whole file, where the platform supports it."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+    except OSError:
+        # Hints are best effort
+        pass
+
+
+def drop_page_cache(file_path: Path) -> None:
+    """
+    Ask the kernel to evict a file's cached pages once it has been consumed.
+    
+    Args:
+        file_path: File that will not be read again soon
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        _fadvise(fd, "POSIX_FADV_DONTNEED")
+    finally:
+        os.close(fd)
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload grows past the allowed size while being saved."""
+
+
 class StorageManager:
     """Manages temporary file storage and cleanup."""
     
     def __init__(self):
         self.temp_dir = Path(settings.temp_dir)
         self.temp_dir.mkdir(parents=True, exist_ok=True)
+        # File operations get their own threads so they do not queue behind
+        # other users of the default executor
+        self._io_pool = ThreadPoolExecutor(
+            max_workers=max(4, os.cpu_count() or 2),
+            thread_name_prefix="e4p-io"
+        )
         self._cleanup_task: Optional[asyncio.Task] = None
         self._start_cleanup_task()
     
@@ -31,59 +91,74 @@ class StorageManager:
             try:
                 await self.cleanup_old_files()
                 await asyncio.sleep(settings.clean_interval_min * 60)
-            except Exception as e:
-                print(f"Cleanup error: {e}")
+            except Exception:
+                logger.exception("Cleanup error")
                 await asyncio.sleep(60)  # Wait 1 minute on error
     
+    def _remove_expired(self, cutoff: float) -> None:
+        """Walk the temp directory and delete files last modified before cutoff."""
+        stack = [str(self.temp_dir)]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif (entry.is_file(follow_symlinks=False) and
+                                  entry.stat(follow_symlinks=False).st_mtime < cutoff):
+                                os.unlink(entry.path)
+                                logger.info("Cleaned up old file: %s", entry.path)
+                        except OSError:
+                            logger.exception("Error cleaning up %s", entry.path)
+            except OSError:
+                logger.exception("Error scanning temp directory")
+    
     async def cleanup_old_files(self):
         """Remove files older than the TTL."""
-        cutoff_time = datetime.utcnow() - timedelta(minutes=settings.file_ttl_min)
+        cutoff = time.time() - settings.file_ttl_min * 60
         
-        for file_path in self.temp_dir.rglob("*"):
-            if file_path.is_file():
-                try:
-                    file_mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
-                    if file_mtime < cutoff_time:
-                        file_path.unlink()
-                        print(f"Cleaned up old file: {file_path}")
-                except Exception as e:
-                    print(f"Error cleaning up {file_path}: {e}")
+        # scandir reuses the directory listing's type info; run the walk off
+        # the event loop
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._remove_expired, cutoff
+        )
     
     def create_temp_file(self, filename: str, suffix: str = "") -> Path:
         """
-        Create a temporary file path.
+        Create an empty temporary file with a unique name.
         
         Args:
             filename: Original filename
             suffix: Optional suffix to add
-            
+        
         Returns:
             Path to temporary file
         """
         # Sanitize filename
-        safe_filename = self._sanitize_filename(filename)
-        if suffix:
-            name, ext = os.path.splitext(safe_filename)
-            safe_filename = f"{name}{suffix}{ext}"
-        
-        # Ensure unique filename
-        counter = 1
-        base_path = self.temp_dir / safe_filename
-        while base_path.exists():
-            name, ext = os.path.splitext(safe_filename)
-            safe_filename = f"{name}_{counter}{ext}"
-            base_path = self.temp_dir / safe_filename
-            counter += 1
-        
-        return base_path
-    
-    def _sanitize_filename(self, filename: str) -> str:
+        name, ext = os.path.splitext(self.sanitize_filename(filename))
+        
+        # Leave room for the random part so the name stays within 255 characters
+        name = name[:max(1, _MAX_NAME_LEN - len(suffix) - len(ext) - _RANDOM_PART_LEN)]
+        
+        # mkstemp creates the file with O_EXCL under a random name, so
+        # concurrent uploads of the same filename never collide
+        fd, path = tempfile.mkstemp(
+            prefix=f"{name}{suffix}_",
+            suffix=ext,
+            dir=str(self.temp_dir)
+        )
+        os.close(fd)
+        
+        return Path(path)
+    
+    def sanitize_filename(self, filename: str) -> str:
         """
         Sanitize filename to prevent path traversal.
         
         Args:
             filename: Original filename
-            
+        
         Returns:
             Sanitized filename
         """
@@ -91,14 +166,12 @@ class StorageManager:
         filename = os.path.basename(filename)
         
         # Remove or replace dangerous characters
-        dangerous_chars = '<>:"/\\|?*'
-        for char in dangerous_chars:
-            filename = filename.replace(char, '_')
+        filename = filename.translate(_SANITIZE_TABLE)
         
         # Limit length
-        if len(filename) > 255:
+        if len(filename) > _MAX_NAME_LEN:
             name, ext = os.path.splitext(filename)
-            filename = name[:255-len(ext)] + ext
+            filename = name[:_MAX_NAME_LEN-len(ext)] + ext
         
         # Ensure filename is not empty
         if not filename or filename == '.' or filename == '..':
@@ -113,38 +186,80 @@ class StorageManager:
         Args:
             file_content: File content bytes
             filename: Original filename
-            
+        
+        Returns:
+            Path to saved file
+        """
+        temp_path = self.create_temp_file(filename)
+        
+        # Open, write and close in one executor job rather than one thread
+        # hop per aiofiles call
+        await asyncio.get_running_loop().run_in_executor(
+            self._io_pool, temp_path.write_bytes, file_content
+        )
+        
+        return temp_path
+    
+    async def save_upload_stream(
+        self,
+        upload: UploadFile,
+        filename: str,
+        max_size: Optional[int] = None
+    ) -> Path:
+        """
+        Stream an upload to temporary storage without buffering it in memory.
+        
+        Args:
+            upload: Uploaded file
+            filename: Original filename
+            max_size: Maximum number of bytes to accept
+        
         Returns:
             Path to saved file
+        
+        Raises:
+            UploadTooLargeError: If more than max_size bytes are received
         """
         temp_path = self.create_temp_file(filename)
+        written = 0
         
-        async with aiofiles.open(temp_path, 'wb') as f:
-            await f.write(file_content)
+        try:
+            async with aiofiles.open(temp_path, 'wb') as f:
+                # Written once front to back, then read once by the encryptor
+                _fadvise(f.fileno(), "POSIX_FADV_SEQUENTIAL")
+                while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                    written += len(chunk)
+                    # Stop as soon as the limit is crossed, whatever the
+                    # client claimed up front
+                    if max_size is not None and written > max_size:
+                        raise UploadTooLargeError(f"{filename} exceeds {max_size} bytes")
+                    await f.write(chunk)
+        except BaseException:
+            await self.delete_file(temp_path)
+            raise
         
         return temp_path
     
     async def copy_file(self, source: Path, dest: Path) -> None:
         """Copy file asynchronously."""
-        def _copy():
-            shutil.copy2(source, dest)
-        
-        await asyncio.get_event_loop().run_in_executor(None, _copy)
+        await asyncio.get_running_loop().run_in_executor(
+            self._io_pool, shutil.copy2, source, dest
+        )
     
     async def move_file(self, source: Path, dest: Path) -> None:
         """Move file asynchronously."""
-        def _move():
-            shutil.move(str(source), str(dest))
-        
-        await asyncio.get_event_loop().run_in_executor(None, _move)
+        await asyncio.get_running_loop().run_in_executor(
+            self._io_pool, shutil.move, str(source), str(dest)
+        )
     
     async def delete_file(self, file_path: Path) -> None:
         """Delete file asynchronously."""
         try:
-            if file_path.exists():
-                file_path.unlink()
-        except Exception as e:
-            print(f"Error deleting file {file_path}: {e}")
+            await asyncio.get_running_loop().run_in_executor(
+                self._io_pool, partial(file_path.unlink, missing_ok=True)
+            )
+        except Exception:
+            logger.exception("Error deleting file %s", file_path)
     
     def get_file_size(self, file_path: Path) -> int:
         """Get file size in bytes."""
@@ -165,12 +280,40 @@ class StorageManager:
         except Exception:
             return None
     
+    def get_file_info_fd(self, fd: int) -> Optional[dict]:
+        """Get file information for an already open file descriptor."""
+        try:
+            stat = os.fstat(fd)
+            return {
+                "size": stat.st_size,
+                "created": datetime.fromtimestamp(stat.st_ctime).isoformat(),
+                "modified": datetime.fromtimestamp(stat.st_mtime).isoformat()
+            }
+        except Exception:
+            return None
+    
     async def cleanup_task_files(self, task_files: List[dict]):
         """Clean up files associated with a task."""
-        for file_info in task_files:
-            for path_key in ["temp_path", "encrypted_path"]:
-                if path_key in file_info:
-                    await self.delete_file(Path(file_info[path_key]))
+        paths = [
+            file_info[path_key]
+            for file_info in task_files
+            for path_key in ("temp_path", "encrypted_path")
+            if path_key in file_info
+        ]
+        if not paths:
+            return
+        
+        def _remove():
+            for path in paths:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    logger.exception("Error deleting file %s", path)
+        
+        # One executor job for the whole task rather than one per file
+        await asyncio.get_running_loop().run_in_executor(self._io_pool, _remove)
     
     async def shutdown(self):
         """Shutdown the storage manager."""
@@ -180,3 +323,5 @@ class StorageManager:
                 await self._cleanup_task
             except asyncio.CancelledError:
                 pass
+        
+        self._io_pool.shutdown(wait=False, cancel_futures=True)
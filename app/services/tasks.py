@@ -1,14 +1,32 @@
 """Task management for encryption jobs."""
 
 import asyncio
+import logging
 import uuid
+from collections import OrderedDict
+from itertools import islice
 from datetime import datetime
 from enum import Enum
 from typing import Dict, Any, Optional
 from dataclasses import dataclass, field
 from pathlib import Path
 
+from app.crypto.kdf import aderive_key, generate_salt
 from app.crypto.stream import StreamProcessor
+from app.services.tokens import TokenManager
+
+
+logger = logging.getLogger("e4p.tasks")
+
+# Oldest finished tasks are evicted once this many are tracked
+MAX_TASKS = 1024
+
+# Slots of the per-task status record polled by /api/status
+_STATUS, _PROGRESS, _COMPLETED_AT, _ERROR = range(4)
+
+
+class TaskStoreFullError(RuntimeError):
+    """Raised when every tracked task is still pending or processing."""
 
 
 class TaskStatus(Enum):
@@ -19,37 +37,48 @@ class TaskStatus(Enum):
     FAILED = "failed"
 
 
-@dataclass
+@dataclass(slots=True)
 class EncryptionTask:
     """Encryption task data structure."""
     
     task_id: str
-    status: TaskStatus
     files: list[Dict[str, Any]]
     password: str
     algorithm: str
-    created_at: datetime = field(default_factory=datetime.utcnow)
-    completed_at: Optional[datetime] = None
-    error_message: Optional[str] = None
-    progress: float = 0.0
+    created_at: datetime
+    # Client-facing entries for finished files, without server paths
+    public_files: list[Dict[str, Any]] = field(default_factory=list)
 
 
 class TaskManager:
     """Manages encryption tasks and processing queue."""
     
-    def __init__(self, max_concurrency: int = 2):
+    def __init__(
+        self,
+        max_concurrency: int = 2,
+        max_tasks: int = MAX_TASKS,
+        token_manager: Optional[TokenManager] = None,
+        processor: Optional[StreamProcessor] = None
+    ):
         self.max_concurrency = max_concurrency
-        self.tasks: Dict[str, EncryptionTask] = {}
+        self.max_tasks = max_tasks
+        self.tasks: "OrderedDict[str, EncryptionTask]" = OrderedDict()
+        # Hot status fields kept apart from the task records:
+        # [status value, progress, completed_at ISO string, error message]
+        self._status: Dict[str, list] = {}
         self.queue = asyncio.Queue()
+        # Workers bound tasks in flight; the semaphore bounds files in flight
         self.semaphore = asyncio.Semaphore(max_concurrency)
-        self.processor = StreamProcessor()
-        self._worker_task: Optional[asyncio.Task] = None
-        self._start_worker()
+        self.processor = processor or StreamProcessor()
+        self.token_manager = token_manager or TokenManager()
+        self._workers: list[asyncio.Task] = []
+        self._start_workers()
     
-    def _start_worker(self):
-        """Start the background worker task."""
-        if self._worker_task is None or self._worker_task.done():
-            self._worker_task = asyncio.create_task(self._worker())
+    def _start_workers(self):
+        """Start one background worker per concurrency slot."""
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.max_concurrency:
+            self._workers.append(asyncio.create_task(self._worker()))
     
     async def _worker(self):
         """Background worker that processes tasks from the queue."""
@@ -58,59 +87,122 @@ class TaskManager:
                 task_id = await self.queue.get()
                 await self._process_task(task_id)
                 self.queue.task_done()
-            except Exception as e:
-                print(f"Worker error: {e}")
+            except Exception:
+                logger.exception("Worker error")
                 await asyncio.sleep(1)
     
+    async def _encrypt_one(
+        self,
+        task: EncryptionTask,
+        file_info: Dict[str, Any],
+        salt: bytes,
+        key: bytes,
+        state: list,
+        processed: list
+    ):
+        """Encrypt one file of a task and record its download token."""
+        input_path = Path(file_info["temp_path"])
+        output_path = Path(file_info["encrypted_path"])
+        
+        # Encrypt the file; the semaphore bounds files in flight across tasks
+        async with self.semaphore:
+            header, size = await self.processor.encrypt_file_with_size(
+                input_path=input_path,
+                output_path=output_path,
+                password=task.password,
+                algorithm=task.algorithm,
+                salt=salt,
+                key=key,
+                original_name=file_info["original_name"]
+            )
+        
+        # Update file info with header data
+        file_info["header"] = header.to_dict()
+        file_info["size"] = size
+        
+        # Generate download token for the encrypted file
+        file_info["download_token"] = self.token_manager.create_download_token(
+            file_path=str(output_path),
+            filename=file_info["original_name"] + ".e4p"
+        )
+        task.public_files.append({
+            "original_name": file_info["original_name"],
+            "size": file_info["size"],
+            "algorithm": task.algorithm,
+            "download_token": file_info["download_token"]
+        })
+        
+        processed[0] += 1
+        state[_PROGRESS] = (processed[0] / len(task.files)) * 100
+    
+    async def _remove_outputs(self, files: list[Dict[str, Any]]) -> None:
+        """Delete encrypted outputs that will not be served."""
+        paths = [Path(file_info["encrypted_path"]) for file_info in files]
+        
+        def _remove():
+            for path in paths:
+                try:
+                    path.unlink(missing_ok=True)
+                except OSError:
+                    logger.exception("Error deleting file %s", path)
+        
+        await asyncio.get_running_loop().run_in_executor(None, _remove)
+    
     async def _process_task(self, task_id: str):
         """Process a single encryption task."""
-        async with self.semaphore:
-            task = self.tasks.get(task_id)
-            if not task:
-                return
+        task = self.tasks.get(task_id)
+        if not task:
+            return
+        
+        # Keep a reference so eviction mid-task cannot raise KeyError
+        state = self._status[task_id]
+        if state[_STATUS] != TaskStatus.PENDING.value:
+            return
+        
+        try:
+            state[_STATUS] = TaskStatus.PROCESSING.value
+            state[_PROGRESS] = 0.0
             
-            try:
-                task.status = TaskStatus.PROCESSING
-                task.progress = 0.0
-                
-                total_files = len(task.files)
-                processed_files = 0
-                
+            # Run Argon2id once per task; files share the salt and key
+            # but each gets its own random nonce
+            salt = generate_salt()
+            key = await aderive_key(task.password, salt)
+            
+            # Encrypt the files concurrently; the first failure cancels and
+            # awaits the others
+            processed = [0]
+            async with asyncio.TaskGroup() as group:
                 for file_info in task.files:
-                    input_path = Path(file_info["temp_path"])
-                    output_path = Path(file_info["encrypted_path"])
-                    
-                    # Encrypt the file
-                    header = await self.processor.encrypt_file(
-                        input_path=input_path,
-                        output_path=output_path,
-                        password=task.password,
-                        algorithm=task.algorithm
-                    )
-                    
-                    # Update file info with header data
-                    file_info["header"] = header.to_dict()
-                    file_info["size"] = output_path.stat().st_size
-                    
-                    # Generate download token for the encrypted file
-                    from app.services.tokens import TokenManager
-                    token_manager = TokenManager()
-                    download_token = token_manager.create_download_token(
-                        file_path=str(output_path),
-                        filename=file_info["original_name"] + ".e4p"
+                    group.create_task(
+                        self._encrypt_one(task, file_info, salt, key, state, processed)
                     )
-                    file_info["download_token"] = download_token
-                    
-                    processed_files += 1
-                    task.progress = (processed_files / total_files) * 100
-                
-                task.status = TaskStatus.COMPLETED
-                task.completed_at = datetime.utcnow()
-                
-            except Exception as e:
-                task.status = TaskStatus.FAILED
-                task.error_message = str(e)
-                task.completed_at = datetime.utcnow()
+        
+        except Exception as e:
+            if isinstance(e, ExceptionGroup):
+                e = e.exceptions[0]
+            
+            # Drop partial outputs of the files that did not finish
+            await self._remove_outputs([
+                file_info for file_info in task.files
+                if "download_token" not in file_info
+            ])
+            
+            # A cancel that landed while processing keeps its own status
+            if state[_STATUS] == TaskStatus.PROCESSING.value:
+                logger.exception("Task %s failed", task_id)
+                state[_STATUS] = TaskStatus.FAILED.value
+                state[_ERROR] = str(e)
+                state[_COMPLETED_AT] = datetime.utcnow().isoformat()
+            return
+        
+        if state[_STATUS] != TaskStatus.PROCESSING.value:
+            # Cancelled while processing; remove outputs written after the
+            # cancel cleaned up the task's files
+            await self._remove_outputs(task.files)
+            return
+        
+        state[_STATUS] = TaskStatus.COMPLETED.value
+        state[_COMPLETED_AT] = datetime.utcnow().isoformat()
     
     async def create_task(
         self,
@@ -125,21 +217,37 @@ class TaskManager:
             files: List of file information dictionaries
             password: User password
             algorithm: Encryption algorithm
-            
+        
         Returns:
             Task ID
+        
+        Raises:
+            TaskStoreFullError: If the store is full of unfinished tasks
         """
+        # Make room by evicting the oldest finished tasks; queued and running
+        # tasks are never dropped
+        excess = len(self.tasks) - self.max_tasks + 1
+        if excess > 0:
+            finished = [old_id for old_id in self.tasks if self.is_finished(old_id)]
+            for old_id in islice(finished, excess):
+                del self.tasks[old_id]
+                del self._status[old_id]
+            if len(self.tasks) >= self.max_tasks:
+                raise TaskStoreFullError("Too many tasks in progress")
+        
         task_id = str(uuid.uuid4())
         
         task = EncryptionTask(
             task_id=task_id,
-            status=TaskStatus.PENDING,
             files=files,
             password=password,
-            algorithm=algorithm
+            algorithm=algorithm,
+            created_at=datetime.utcnow()
         )
         
         self.tasks[task_id] = task
+        self._status[task_id] = [TaskStatus.PENDING.value, 0.0, None, None]
+        
         await self.queue.put(task_id)
         
         return task_id
@@ -150,38 +258,62 @@ class TaskManager:
     
     def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Get task status information."""
-        task = self.tasks.get(task_id)
-        if not task:
+        state = self._status.get(task_id)
+        if state is None:
             return None
         
+        task = self.tasks[task_id]
         return {
-            "task_id": task.task_id,
-            "status": task.status.value,
-            "progress": task.progress,
-            "files": task.files,
+            "task_id": task_id,
+            "status": state[_STATUS],
+            "progress": state[_PROGRESS],
+            "files": task.public_files,
             "created_at": task.created_at.isoformat(),
-            "completed_at": task.completed_at.isoformat() if task.completed_at else None,
-            "error_message": task.error_message
+            "completed_at": state[_COMPLETED_AT],
+            "error_message": state[_ERROR]
         }
     
+    def is_finished(self, task_id: str) -> bool:
+        """Check whether a task has completed or failed."""
+        state = self._status.get(task_id)
+        return state is not None and state[_STATUS] in (
+            TaskStatus.COMPLETED.value,
+            TaskStatus.FAILED.value
+        )
+    
+    def fail_task(self, task_id: str, message: str) -> None:
+        """
+        Mark a task as failed.
+        
+        Args:
+            task_id: Task ID
+            message: Error message reported in the task status
+        """
+        state = self._status.get(task_id)
+        if state is None:
+            return
+        
+        state[_STATUS] = TaskStatus.FAILED.value
+        state[_ERROR] = message
+        state[_COMPLETED_AT] = datetime.utcnow().isoformat()
+    
     async def cleanup_old_tasks(self, max_age_hours: int = 24):
         """Clean up old completed tasks."""
         cutoff_time = datetime.utcnow().timestamp() - (max_age_hours * 3600)
         
         tasks_to_remove = []
         for task_id, task in self.tasks.items():
-            if (task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED] and
+            if (self.is_finished(task_id) and
                 task.created_at.timestamp() < cutoff_time):
                 tasks_to_remove.append(task_id)
         
         for task_id in tasks_to_remove:
             del self.tasks[task_id]
+            del self._status[task_id]
     
     async def shutdown(self):
         """Shutdown the task manager."""
-        if self._worker_task:
-            self._worker_task.cancel()
-            try:
-                await self._worker_task
-            except asyncio.CancelledError:
-                pass
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
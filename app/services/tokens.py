@@ -1,21 +1,84 @@
 """Token management for secure downloads."""
 
 import base64
+import binascii
 import hashlib
 import hmac
+import struct
 import time
-from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 
 from app.config import settings
 
 
+# Token payload: expires, timestamp, path length, filename length; followed
+# by the UTF-8 path and filename, then the signature
+_TOKEN_FIXED = struct.Struct('<QQHH')
+_SIGNATURE_SIZE = 32
+
+# Encoded length bounds, from an empty path and name up to the largest
+# lengths the u16 fields can describe
+_MIN_TOKEN_LEN = 4 * ((_TOKEN_FIXED.size + _SIGNATURE_SIZE + 2) // 3)
+_MAX_TOKEN_LEN = 4 * ((_TOKEN_FIXED.size + 2 * 0xFFFF + _SIGNATURE_SIZE + 2) // 3)
+
+
 class TokenManager:
     """Manages secure download tokens."""
     
     def __init__(self):
         self.secret_key = settings.secret_key.encode('utf-8')
         self.token_ttl = settings.download_token_ttl_s
+        # BLAKE2b accepts keys of at most 64 bytes; hash longer secrets down
+        if len(self.secret_key) > hashlib.blake2b.MAX_KEY_SIZE:
+            self._mac_key = hashlib.blake2b(self.secret_key).digest()
+        else:
+            self._mac_key = self.secret_key
+    
+    def _sign(self, payload: bytes) -> bytes:
+        """Compute the keyed BLAKE2b signature of a token payload."""
+        return hashlib.blake2b(payload, key=self._mac_key, digest_size=_SIGNATURE_SIZE).digest()
+    
+    def _decode_token(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Decode a token and verify its signature, without checking expiry.
+        
+        Args:
+            token: Base64 encoded token
+        
+        Returns:
+            Token data if the signature is valid, None otherwise
+        """
+        # Reject impossible lengths before doing any decoding work
+        if not token or not (_MIN_TOKEN_LEN <= len(token) <= _MAX_TOKEN_LEN):
+            return None
+        
+        try:
+            token_bytes = base64.urlsafe_b64decode(token.encode('ascii'))
+        except (binascii.Error, UnicodeEncodeError):
+            return None
+        
+        if len(token_bytes) < _TOKEN_FIXED.size + _SIGNATURE_SIZE:
+            return None
+        
+        # Signature is a fixed-size suffix, so no separator is needed
+        payload = token_bytes[:-_SIGNATURE_SIZE]
+        signature = token_bytes[-_SIGNATURE_SIZE:]
+        
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        
+        # Only tokens we signed get this far, so the layout can be trusted
+        expires, timestamp, path_len, name_len = _TOKEN_FIXED.unpack_from(payload, 0)
+        if len(payload) != _TOKEN_FIXED.size + path_len + name_len:
+            return None
+        
+        path_end = _TOKEN_FIXED.size + path_len
+        return {
+            "file_path": payload[_TOKEN_FIXED.size:path_end].decode('utf-8'),
+            "filename": payload[path_end:].decode('utf-8'),
+            "expires": expires,
+            "timestamp": timestamp
+        }
     
     def create_download_token(self, file_path: str, filename: str) -> str:
         """
@@ -24,35 +87,24 @@ class TokenManager:
         Args:
             file_path: Path to the file to download
             filename: Original filename
-            
+        
         Returns:
             Base64 encoded token
         """
-        # Create token data
-        token_data = {
-            "file_path": file_path,
-            "filename": filename,
-            "expires": int(time.time()) + self.token_ttl,
-            "timestamp": int(time.time())
-        }
+        now = int(time.time())
+        path_bytes = file_path.encode('utf-8')
+        name_bytes = filename.encode('utf-8')
         
         # Serialize token data
-        import json
-        data_json = json.dumps(token_data, separators=(',', ':'))
-        data_bytes = data_json.encode('utf-8')
-        
-        # Create HMAC signature
-        signature = hmac.new(
-            self.secret_key,
-            data_bytes,
-            hashlib.sha256
-        ).digest()
-        
-        # Combine data and signature
-        token_bytes = data_bytes + b'|' + signature
-        
-        # Encode as base64
-        return base64.urlsafe_b64encode(token_bytes).decode('utf-8')
+        payload = _TOKEN_FIXED.pack(
+            now + self.token_ttl,
+            now,
+            len(path_bytes),
+            len(name_bytes)
+        ) + path_bytes + name_bytes
+        
+        # Combine data and signature, then encode as base64
+        return base64.urlsafe_b64encode(payload + self._sign(payload)).decode('utf-8')
     
     def validate_token(self, token: str) -> Optional[Dict[str, Any]]:
         """
@@ -60,68 +112,33 @@ class TokenManager:
         
         Args:
             token: Base64 encoded token
-            
+        
         Returns:
             Token data if valid, None if invalid
         """
-        try:
-            # Decode token
-            token_bytes = base64.urlsafe_b64decode(token.encode('utf-8'))
-            
-            # Split data and signature
-            if b'|' not in token_bytes:
-                return None
-            
-            data_bytes, signature = token_bytes.split(b'|', 1)
-            
-            # Verify signature
-            expected_signature = hmac.new(
-                self.secret_key,
-                data_bytes,
-                hashlib.sha256
-            ).digest()
-            
-            if not hmac.compare_digest(signature, expected_signature):
-                return None
-            
-            # Parse token data
-            import json
-            token_data = json.loads(data_bytes.decode('utf-8'))
-            
-            # Check expiration
-            current_time = int(time.time())
-            expires_time = token_data.get("expires", 0)
-            if expires_time < current_time:
-                return None
-            
-            return token_data
-            
-        except Exception:
+        token_data = self._decode_token(token)
+        if token_data is None:
+            return None
+        
+        # Check expiration
+        if token_data["expires"] < time.time():
             return None
+        
+        return token_data
     
     def is_token_valid(self, token: str) -> bool:
         """Check if token is valid without returning data."""
         return self.validate_token(token) is not None
     
     def get_token_info(self, token: str) -> Optional[Dict[str, Any]]:
-        """Get token information without validation."""
-        try:
-            token_bytes = base64.urlsafe_b64decode(token.encode('utf-8'))
-            
-            if b'.' not in token_bytes:
-                return None
-            
-            data_bytes = token_bytes.split(b'.', 1)[0]
-            
-            import json
-            token_data = json.loads(data_bytes.decode('utf-8'))
-            
-            return {
-                "filename": token_data.get("filename"),
-                "expires": token_data.get("expires"),
-                "timestamp": token_data.get("timestamp"),
-                "is_expired": token_data.get("expires", 0) < int(time.time())
-            }
-            
-        except Exception:
+        """Get token information, including for expired tokens."""
+        token_data = self._decode_token(token)
+        if token_data is None:
             return None
+        
+        return {
+            "filename": token_data["filename"],
+            "expires": token_data["expires"],
+            "timestamp": token_data["timestamp"],
+            "is_expired": token_data["expires"] < time.time()
+        }
@@ -302,7 +302,10 @@ async function encryptFiles(files, password, algorithm) {
         
         if (!response.ok) {
             const error = await response.json();
-            throw new Error(error.detail || 'Encryption failed');
+            const detail = error.detail && error.detail.errors
+                ? error.detail.errors.map(e => `${e.original_name}: ${e.error}`).join('\n')
+                : error.detail;
+            throw new Error(detail || 'Encryption failed');
         }
         
         const result = await response.json();
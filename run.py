@@ -33,7 +33,10 @@ if __name__ == "__main__":
             "app.main:app",
             host=settings.app_host,
             port=settings.app_port,
-            reload=True,
+            # The reloader's file watcher is for development only. With the
+            # default loop/http "auto", uvicorn picks uvloop and httptools
+            # when uvicorn[standard] installed them
+            reload=settings.debug,
             log_level="info"
         )
     except KeyboardInterrupt:
@@ -6,41 +6,37 @@ import tempfile
 from pathlib import Path
 from app.crypto.stream import StreamProcessor
 from app.crypto.kdf import derive_key, generate_salt
+from app.crypto.kdf_cache import derive_key_cached
 from app.crypto.aead import create_encryptor
 
 
-async def test_basic_encryption():
-    """Test basic encryption and decryption functionality."""
-    print("Testing basic encryption/decryption...")
-    
-    # Create test file
-    test_content = b"Hello, World! This is a test file for E4P encryption."
-    
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        temp_file.write(test_content)
-        temp_file.flush()
-        input_path = Path(temp_file.name)
+async def _roundtrip(
+    processor: StreamProcessor,
+    input_path: Path,
+    password: str,
+    salt: bytes,
+    key: bytes,
+    algorithm: str,
+    test_content: bytes
+) -> bool:
+    """Encrypt and decrypt a file with one algorithm and compare the result."""
+    suffix = algorithm.split("-")[0].lower()
+    encrypted_path = Path(f"{input_path}_{suffix}.e4p")
+    decrypted_path = Path(f"{input_path}_{suffix}_decrypted")
     
     try:
-        # Create output paths
-        encrypted_path = Path(temp_file.name + ".e4p")
-        decrypted_path = Path(temp_file.name + "_decrypted")
-        
-        processor = StreamProcessor()
-        password = "test_password_123"
-        
-        # Test AES-256-GCM
-        print("  Testing AES-256-GCM...")
         header = await processor.encrypt_file(
             input_path=input_path,
             output_path=encrypted_path,
             password=password,
-            algorithm="AES-256-GCM"
+            algorithm=algorithm,
+            salt=salt,
+            key=key
         )
         
+        print(f"  {algorithm}:")
         print(f"    Original size: {len(test_content)} bytes")
         print(f"    Encrypted size: {encrypted_path.stat().st_size} bytes")
-        print(f"    Algorithm: {header.algorithm}")
         print(f"    Original name: {header.original_name}")
         
         # Decrypt
@@ -50,62 +46,52 @@ async def test_basic_encryption():
             password=password
         )
         
-        if success:
-            with open(decrypted_path, 'rb') as f:
-                decrypted_content = f.read()
-            
-            if decrypted_content == test_content:
-                print("    ✓ AES-256-GCM encryption/decryption successful")
-            else:
-                print("    ✗ AES-256-GCM decryption failed - content mismatch")
-                return False
-        else:
-            print("    ✗ AES-256-GCM decryption failed")
+        if not success:
+            print(f"    ✗ {algorithm} decryption failed")
             return False
         
-        # Clean up
-        encrypted_path.unlink()
-        decrypted_path.unlink()
-        
-        # Test XChaCha20-Poly1305
-        print("  Testing XChaCha20-Poly1305...")
-        encrypted_path = Path(temp_file.name + "_xchacha.e4p")
-        decrypted_path = Path(temp_file.name + "_xchacha_decrypted")
-        
-        header = await processor.encrypt_file(
-            input_path=input_path,
-            output_path=encrypted_path,
-            password=password,
-            algorithm="XCHACHA20-POLY1305"
-        )
-        
-        print(f"    Algorithm: {header.algorithm}")
-        
-        success = await processor.decrypt_file(
-            input_path=encrypted_path,
-            output_path=decrypted_path,
-            password=password
-        )
-        
-        if success:
-            with open(decrypted_path, 'rb') as f:
-                decrypted_content = f.read()
-            
-            if decrypted_content == test_content:
-                print("    ✓ XChaCha20-Poly1305 encryption/decryption successful")
-            else:
-                print("    ✗ XChaCha20-Poly1305 decryption failed - content mismatch")
-                return False
-        else:
-            print("    ✗ XChaCha20-Poly1305 decryption failed")
+        if decrypted_path.read_bytes() != test_content:
+            print(f"    ✗ {algorithm} decryption failed - content mismatch")
             return False
         
+        print(f"    ✓ {algorithm} encryption/decryption successful")
+        return True
+    
+    finally:
         # Clean up
-        encrypted_path.unlink()
-        decrypted_path.unlink()
+        for path in (encrypted_path, decrypted_path):
+            if path.exists():
+                path.unlink()
+
+
+async def test_basic_encryption():
+    """Test basic encryption and decryption functionality."""
+    print("Testing basic encryption/decryption...")
+    
+    # Create test file
+    test_content = b"Hello, World! This is a test file for E4P encryption."
+    
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        temp_file.write(test_content)
+        temp_file.flush()
+        input_path = Path(temp_file.name)
+    
+    try:
+        processor = StreamProcessor()
+        password = "test_password_123"
         
-        return True
+        # Run Argon2id once; the cached key also serves both decryptions
+        salt = generate_salt()
+        key = derive_key_cached(password, salt)
+        
+        # The algorithms write to separate paths, so run them concurrently
+        results = await asyncio.gather(*(
+            _roundtrip(processor, input_path, password, salt, key, algorithm, test_content)
+            for algorithm in ("AES-256-GCM", "XCHACHA20-POLY1305")
+        ))
         
+        return all(results)
+    
     finally:
         # Clean up input file
         if input_path.exists():
@@ -208,7 +194,7 @@ async def main():
         print("Then open http://localhost:8080 in your browser.")
         
         return True
-        
+    
     except Exception as e:
         print(f"✗ Test failed with error: {e}")
         import traceback
@@ -0,0 +1,39 @@
+"""Shared pytest configuration."""
+
+import asyncio
+import os
+
+import pytest
+
+from app.config import settings
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
+
+# Keep test files in RAM where a tmpfs is available; tmp_path and tempfile
+# both read TMPDIR when they first pick a directory
+if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+    os.environ.setdefault("TMPDIR", "/dev/shm")
+
+# Run async tests on the same loop uvicorn uses in production; the
+# pytest-asyncio event_loop fixture builds its loops from this policy
+if uvloop is not None:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+# Cheapest Argon2id cost that still passes header validation (m >= 1 MB)
+_FAST_KDF = {
+    "argon2_memory_mb": 1,
+    "argon2_time_cost": 1,
+    "argon2_parallelism": 1,
+}
+
+
+@pytest.fixture(autouse=True)
+def fast_kdf(request, monkeypatch):
+    """Use a minimal Argon2id cost unless the test is marked slow."""
+    if request.node.get_closest_marker("slow") is None:
+        for name, value in _FAST_KDF.items():
+            monkeypatch.setattr(settings, name, value)
@@ -1,124 +1,149 @@
 """Tests for AEAD encryption implementations."""
 
 import pytest
+from nacl.bindings import crypto_aead_xchacha20poly1305_ietf_encrypt, crypto_secretbox
 from app.crypto.aead import (
     AESGCMEncryptor, 
     XChaCha20Poly1305Encryptor, 
+    XSalsa20Poly1305Encryptor,
     create_encryptor,
+    derive_chunk_nonce,
+    derive_chunk_nonces,
     encrypt_stream,
-    decrypt_stream
+    decrypt_stream,
+    encrypt_stream_sync,
+    decrypt_stream_sync,
+    encrypt_stream_counter,
+    decrypt_stream_counter
 )
 import asyncio
 
 
+KEY = b"a" * 32
+
+
+@pytest.fixture(scope="module")
+def aes_encryptor():
+    """AES-256-GCM encryptor shared by the tests in this module."""
+    return AESGCMEncryptor(KEY)
+
+
+@pytest.fixture(scope="module")
+def xchacha_encryptor():
+    """XChaCha20-Poly1305 encryptor shared by the tests in this module."""
+    return XChaCha20Poly1305Encryptor(KEY)
+
+
 class TestAESGCMEncryptor:
     """Test AES-256-GCM encryption."""
     
-    def test_encryptor_creation(self):
+    def test_encryptor_creation(self, aes_encryptor):
         """Test encryptor creation with valid key."""
-        key = b"a" * 32  # 32 bytes for AES-256
-        encryptor = AESGCMEncryptor(key)
-        assert encryptor.get_algorithm_name() == "AES-256-GCM"
+        assert aes_encryptor.get_algorithm_name() == "AES-256-GCM"
     
     def test_encryptor_invalid_key(self):
         """Test encryptor creation with invalid key length."""
         with pytest.raises(ValueError):
             AESGCMEncryptor(b"short_key")
     
-    def test_encrypt_decrypt_roundtrip(self):
+    def test_encrypt_decrypt_roundtrip(self, aes_encryptor):
         """Test encrypt/decrypt roundtrip."""
-        key = b"a" * 32
-        encryptor = AESGCMEncryptor(key)
         data = b"Hello, World! This is test data."
         
         # Encrypt
-        nonce = encryptor.generate_nonce()
-        encrypted = encryptor.encrypt_chunk(data, nonce)
+        nonce = aes_encryptor.generate_nonce()
+        encrypted = aes_encryptor.encrypt_chunk(data, nonce)
         
         # Decrypt
-        decrypted = encryptor.decrypt_chunk(encrypted, nonce)
+        decrypted = aes_encryptor.decrypt_chunk(encrypted, nonce)
         
         assert decrypted == data
         assert encrypted != data  # Should be different
     
-    def test_nonce_generation(self):
+    def test_nonce_generation(self, aes_encryptor):
         """Test nonce generation."""
-        key = b"a" * 32
-        encryptor = AESGCMEncryptor(key)
-        
-        nonce1 = encryptor.generate_nonce()
-        nonce2 = encryptor.generate_nonce()
+        nonce1 = aes_encryptor.generate_nonce()
+        nonce2 = aes_encryptor.generate_nonce()
         
         assert len(nonce1) == 12  # AES-GCM nonce size
         assert len(nonce2) == 12
         assert nonce1 != nonce2  # Should be different
     
-    def test_invalid_nonce_size(self):
+    def test_invalid_nonce_size(self, aes_encryptor):
         """Test with invalid nonce size."""
-        key = b"a" * 32
-        encryptor = AESGCMEncryptor(key)
         data = b"test data"
         
         with pytest.raises(ValueError):
-            encryptor.encrypt_chunk(data, b"short_nonce")
+            aes_encryptor.encrypt_chunk(data, b"short_nonce")
         
         with pytest.raises(ValueError):
-            encryptor.decrypt_chunk(data, b"short_nonce")
+            aes_encryptor.decrypt_chunk(data, b"short_nonce")
 
 
 class TestXChaCha20Poly1305Encryptor:
     """Test XChaCha20-Poly1305 encryption."""
     
-    def test_encryptor_creation(self):
+    def test_encryptor_creation(self, xchacha_encryptor):
         """Test encryptor creation with valid key."""
-        key = b"a" * 32  # 32 bytes for XChaCha20
-        encryptor = XChaCha20Poly1305Encryptor(key)
-        assert encryptor.get_algorithm_name() == "XCHACHA20-POLY1305"
+        assert xchacha_encryptor.get_algorithm_name() == "XCHACHA20-POLY1305"
     
     def test_encryptor_invalid_key(self):
         """Test encryptor creation with invalid key length."""
         with pytest.raises(ValueError):
             XChaCha20Poly1305Encryptor(b"short_key")
     
-    def test_encrypt_decrypt_roundtrip(self):
+    def test_encrypt_decrypt_roundtrip(self, xchacha_encryptor):
         """Test encrypt/decrypt roundtrip."""
-        key = b"a" * 32
-        encryptor = XChaCha20Poly1305Encryptor(key)
         data = b"Hello, World! This is test data."
         
         # Encrypt
-        nonce = encryptor.generate_nonce()
-        encrypted = encryptor.encrypt_chunk(data, nonce)
+        nonce = xchacha_encryptor.generate_nonce()
+        encrypted = xchacha_encryptor.encrypt_chunk(data, nonce)
         
         # Decrypt
-        decrypted = encryptor.decrypt_chunk(encrypted, nonce)
+        decrypted = xchacha_encryptor.decrypt_chunk(encrypted, nonce)
         
         assert decrypted == data
         assert encrypted != data  # Should be different
     
-    def test_nonce_generation(self):
+    def test_nonce_generation(self, xchacha_encryptor):
         """Test nonce generation."""
-        key = b"a" * 32
-        encryptor = XChaCha20Poly1305Encryptor(key)
-        
-        nonce1 = encryptor.generate_nonce()
-        nonce2 = encryptor.generate_nonce()
+        nonce1 = xchacha_encryptor.generate_nonce()
+        nonce2 = xchacha_encryptor.generate_nonce()
         
         assert len(nonce1) == 24  # XChaCha20 nonce size
         assert len(nonce2) == 24
         assert nonce1 != nonce2  # Should be different
     
-    def test_invalid_nonce_size(self):
+    def test_invalid_nonce_size(self, xchacha_encryptor):
         """Test with invalid nonce size."""
-        key = b"a" * 32
-        encryptor = XChaCha20Poly1305Encryptor(key)
         data = b"test data"
         
         with pytest.raises(ValueError):
-            encryptor.encrypt_chunk(data, b"short_nonce")
+            xchacha_encryptor.encrypt_chunk(data, b"short_nonce")
         
         with pytest.raises(ValueError):
-            encryptor.decrypt_chunk(data, b"short_nonce")
+            xchacha_encryptor.decrypt_chunk(data, b"short_nonce")
+    
+    def test_uses_ietf_construction(self):
+        """Test that output is IETF XChaCha20-Poly1305, not secretbox."""
+        nonce = bytes(range(24))
+        data = b"Hello, World! This is test data."
+        
+        encrypted = XChaCha20Poly1305Encryptor(KEY).encrypt_chunk(data, nonce)
+        
+        assert encrypted == crypto_aead_xchacha20poly1305_ietf_encrypt(data, None, nonce, KEY)
+        assert encrypted != crypto_secretbox(data, nonce, KEY)
+    
+    def test_xsalsa20_roundtrip(self):
+        """Test the secretbox encryptor kept for older files."""
+        encryptor = XSalsa20Poly1305Encryptor(KEY)
+        nonce = encryptor.generate_nonce()
+        encrypted = encryptor.encrypt_chunk(b"legacy data", nonce)
+        
+        assert encryptor.get_algorithm_name() == "XSALSA20-POLY1305"
+        assert encryptor.decrypt_chunk(encrypted, nonce) == b"legacy data"
+        assert encryptor.decrypt_legacy_chunk(nonce + encrypted, nonce) == b"legacy data"
 
 
 class TestCreateEncryptor:
@@ -126,32 +151,83 @@ class TestCreateEncryptor:
     
     def test_create_aes_gcm(self):
         """Test creating AES-GCM encryptor."""
-        key = b"a" * 32
-        encryptor = create_encryptor("AES-256-GCM", key)
+        encryptor = create_encryptor("AES-256-GCM", KEY)
         assert isinstance(encryptor, AESGCMEncryptor)
     
     def test_create_xchacha20(self):
         """Test creating XChaCha20 encryptor."""
-        key = b"a" * 32
-        encryptor = create_encryptor("XCHACHA20-POLY1305", key)
+        encryptor = create_encryptor("XCHACHA20-POLY1305", KEY)
         assert isinstance(encryptor, XChaCha20Poly1305Encryptor)
     
     def test_create_invalid_algorithm(self):
         """Test creating encryptor with invalid algorithm."""
-        key = b"a" * 32
         with pytest.raises(ValueError):
-            create_encryptor("INVALID_ALGORITHM", key)
+            create_encryptor("INVALID_ALGORITHM", KEY)
+    
+    def test_cipher_reused_for_same_key(self):
+        """Test that encryptors sharing a key reuse the cipher object."""
+        first = create_encryptor("AES-256-GCM", KEY)
+        second = create_encryptor("AES-256-GCM", KEY)
+        assert first.cipher is second.cipher
+
+
+class TestChunkNonce:
+    """Test counter-derived chunk nonces."""
+    
+    def test_first_chunk_uses_base_nonce(self):
+        """Test that chunk 0 uses the base nonce unchanged."""
+        base_nonce = bytes(range(12))
+        assert derive_chunk_nonce(base_nonce, 0) == base_nonce
+    
+    def test_chunk_nonces_unique(self):
+        """Test that chunk nonces differ and keep the base length."""
+        for size in (12, 24):
+            base_nonce = bytes(range(size))
+            nonces = {derive_chunk_nonce(base_nonce, i) for i in range(1000)}
+            assert len(nonces) == 1000
+            assert all(len(nonce) == size for nonce in nonces)
+            assert all(nonce[:-8] == base_nonce[:-8] for nonce in nonces)
+    
+    def test_chunk_nonce_run_matches_single(self):
+        """Test that a run of nonces matches per-index derivation."""
+        base_nonce = bytes(range(24))
+        expected = [derive_chunk_nonce(base_nonce, i) for i in range(5, 25)]
+        assert derive_chunk_nonces(base_nonce, 5, 20) == expected
 
 
 class TestStreamEncryption:
     """Test streaming encryption functionality."""
     
+    def test_sync_stream_roundtrip(self, aes_encryptor, xchacha_encryptor):
+        """Test the synchronous stream helpers match the async layout."""
+        test_data = [b"chunk1", b"", b"chunk2", b"chunk3"]
+        
+        for encryptor, nonce_size in ((aes_encryptor, 12), (xchacha_encryptor, 24)):
+            encrypted_chunks = list(encrypt_stream_sync(encryptor, test_data))
+            
+            # Empty chunks are skipped, as in encrypt_stream
+            assert len(encrypted_chunks) == 3
+            assert list(decrypt_stream_sync(encryptor, encrypted_chunks, nonce_size)) == [
+                b"chunk1", b"chunk2", b"chunk3"
+            ]
+    
     @pytest.mark.asyncio
-    async def test_encrypt_stream_aes(self):
-        """Test AES-GCM stream encryption."""
-        key = b"a" * 32
-        encryptor = AESGCMEncryptor(key)
+    async def test_sync_and_async_streams_interoperate(self, aes_encryptor):
+        """Test that chunks from encrypt_stream_sync decrypt with decrypt_stream."""
+        encrypted_chunks = list(encrypt_stream_sync(aes_encryptor, [b"chunk1", b"chunk2"]))
+        
+        async def encrypted_stream():
+            for chunk in encrypted_chunks:
+                yield chunk
         
+        decrypted_chunks = [
+            chunk async for chunk in decrypt_stream(aes_encryptor, encrypted_stream(), 12)
+        ]
+        assert decrypted_chunks == [b"chunk1", b"chunk2"]
+    
+    @pytest.mark.asyncio
+    async def test_encrypt_stream_aes(self, aes_encryptor):
+        """Test AES-GCM stream encryption."""
         # Create test data
         test_data = [b"chunk1", b"chunk2", b"chunk3"]
         
@@ -161,18 +237,15 @@ class TestStreamEncryption:
         
         # Encrypt stream
         encrypted_chunks = []
-        async for chunk in encrypt_stream(encryptor, input_stream()):
+        async for chunk in encrypt_stream(aes_encryptor, input_stream()):
             encrypted_chunks.append(chunk)
         
         assert len(encrypted_chunks) == 3
         assert all(len(chunk) > 0 for chunk in encrypted_chunks)
     
     @pytest.mark.asyncio
-    async def test_encrypt_stream_xchacha20(self):
+    async def test_encrypt_stream_xchacha20(self, xchacha_encryptor):
         """Test XChaCha20 stream encryption."""
-        key = b"a" * 32
-        encryptor = XChaCha20Poly1305Encryptor(key)
-        
         # Create test data
         test_data = [b"chunk1", b"chunk2", b"chunk3"]
         
@@ -182,18 +255,15 @@ class TestStreamEncryption:
         
         # Encrypt stream
         encrypted_chunks = []
-        async for chunk in encrypt_stream(encryptor, input_stream()):
+        async for chunk in encrypt_stream(xchacha_encryptor, input_stream()):
             encrypted_chunks.append(chunk)
         
         assert len(encrypted_chunks) == 3
         assert all(len(chunk) > 0 for chunk in encrypted_chunks)
     
     @pytest.mark.asyncio
-    async def test_decrypt_stream_aes(self):
+    async def test_decrypt_stream_aes(self, aes_encryptor):
         """Test AES-GCM stream decryption."""
-        key = b"a" * 32
-        encryptor = AESGCMEncryptor(key)
-        
         # Create test data
         test_data = [b"chunk1", b"chunk2", b"chunk3"]
         
@@ -203,7 +273,7 @@ class TestStreamEncryption:
             for chunk in test_data:
                 yield chunk
         
-        async for chunk in encrypt_stream(encryptor, input_stream()):
+        async for chunk in encrypt_stream(aes_encryptor, input_stream()):
             encrypted_chunks.append(chunk)
         
         # Now decrypt
@@ -212,18 +282,15 @@ class TestStreamEncryption:
                 yield chunk
         
         decrypted_chunks = []
-        async for chunk in decrypt_stream(encryptor, encrypted_stream(), 12):  # 12 bytes nonce for AES-GCM
+        async for chunk in decrypt_stream(aes_encryptor, encrypted_stream(), 12):  # 12 bytes nonce for AES-GCM
             decrypted_chunks.append(chunk)
         
         assert len(decrypted_chunks) == 3
         assert decrypted_chunks == test_data
     
     @pytest.mark.asyncio
-    async def test_decrypt_stream_xchacha20(self):
+    async def test_decrypt_stream_xchacha20(self, xchacha_encryptor):
         """Test XChaCha20 stream decryption."""
-        key = b"a" * 32
-        encryptor = XChaCha20Poly1305Encryptor(key)
-        
         # Create test data
         test_data = [b"chunk1", b"chunk2", b"chunk3"]
         
@@ -233,7 +300,7 @@ class TestStreamEncryption:
             for chunk in test_data:
                 yield chunk
         
-        async for chunk in encrypt_stream(encryptor, input_stream()):
+        async for chunk in encrypt_stream(xchacha_encryptor, input_stream()):
             encrypted_chunks.append(chunk)
         
         # Now decrypt
@@ -242,8 +309,59 @@ class TestStreamEncryption:
                 yield chunk
         
         decrypted_chunks = []
-        async for chunk in decrypt_stream(encryptor, encrypted_stream(), 24):  # 24 bytes nonce for XChaCha20
+        async for chunk in decrypt_stream(xchacha_encryptor, encrypted_stream(), 24):  # 24 bytes nonce for XChaCha20
             decrypted_chunks.append(chunk)
         
         assert len(decrypted_chunks) == 3
         assert decrypted_chunks == test_data
+    
+    @pytest.mark.asyncio
+    async def test_counter_stream_roundtrip(self):
+        """Test counter-nonce stream encryption roundtrip."""
+        for encryptor in (AESGCMEncryptor(KEY), XChaCha20Poly1305Encryptor(KEY)):
+            base_nonce = encryptor.generate_nonce()
+            test_data = [b"chunk1", b"chunk2", b"chunk3"]
+            
+            async def input_stream():
+                for chunk in test_data:
+                    yield chunk
+            
+            encrypted_chunks = []
+            async for chunk in encrypt_stream_counter(encryptor, input_stream(), base_nonce):
+                encrypted_chunks.append(chunk)
+            
+            assert all(
+                len(chunk) == len(data) + encryptor.overhead
+                for chunk, data in zip(encrypted_chunks, test_data)
+            )
+            
+            async def encrypted_stream():
+                for chunk in encrypted_chunks:
+                    yield chunk
+            
+            decrypted_chunks = []
+            async for chunk in decrypt_stream_counter(encryptor, encrypted_stream(), base_nonce):
+                decrypted_chunks.append(chunk)
+            
+            assert decrypted_chunks == test_data
+    
+    @pytest.mark.asyncio
+    async def test_counter_stream_rejects_reordering(self, aes_encryptor):
+        """Test that swapped chunks fail authentication."""
+        base_nonce = aes_encryptor.generate_nonce()
+        
+        async def input_stream():
+            for chunk in [b"chunk1", b"chunk2"]:
+                yield chunk
+        
+        encrypted_chunks = []
+        async for chunk in encrypt_stream_counter(aes_encryptor, input_stream(), base_nonce):
+            encrypted_chunks.append(chunk)
+        
+        async def swapped_stream():
+            for chunk in reversed(encrypted_chunks):
+                yield chunk
+        
+        with pytest.raises(Exception):
+            async for _ in decrypt_stream_counter(aes_encryptor, swapped_stream(), base_nonce):
+                pass
@@ -1,8 +1,11 @@
 """Tests for E4P container format."""
 
 import pytest
+import base64
 import json
-from app.crypto.container import E4PContainer, E4PHeader, E4P_MAGIC
+import zlib
+from datetime import datetime
+from app.crypto.container import E4PContainer, E4PHeader, E4P_MAGIC, E4P_MAGIC_V2
 
 
 class TestE4PHeader:
@@ -14,8 +17,8 @@ class TestE4PHeader:
             algorithm="AES-256-GCM",
             kdf="argon2id",
             kdf_params={"m": 262144, "t": 3, "p": 2},
-            salt="dGVzdF9zYWx0",
-            nonce="dGVzdF9ub25jZQ==",
+            salt=b"test_salt_16_byte",
+            nonce=b"test_nonce12",
             original_name="test.txt",
             original_size=1024,
             timestamp="2024-01-01T00:00:00Z"
@@ -33,8 +36,8 @@ class TestE4PHeader:
             "alg": "AES-256-GCM",
             "kdf": "argon2id",
             "kdf_params": {"m": 262144, "t": 3, "p": 2},
-            "salt": "dGVzdF9zYWx0",
-            "nonce": "dGVzdF9ub25jZQ==",
+            "salt": "dGVzdF9zYWx0XzE2X2J5dGU=",
+            "nonce": "dGVzdF9ub25jZTEy",
             "orig_name": "test.txt",
             "orig_size": 1024,
             "ts": "2024-01-01T00:00:00Z"
@@ -78,6 +81,9 @@ class TestE4PContainer:
         assert header.original_size == original_size
         assert len(header.salt) > 0
         assert len(header.nonce) > 0
+        
+        # RFC3339 UTC timestamp with second resolution
+        assert datetime.strptime(header.timestamp, "%Y-%m-%dT%H:%M:%SZ")
     
     def test_serialize_header(self):
         """Test header serialization."""
@@ -86,8 +92,8 @@ class TestE4PContainer:
             algorithm="AES-256-GCM",
             kdf="argon2id",
             kdf_params={"m": 262144, "t": 3, "p": 2},
-            salt="dGVzdF9zYWx0",
-            nonce="dGVzdF9ub25jZQ==",
+            salt=b"test_salt_16_byte",
+            nonce=b"test_nonce12",
             original_name="test.txt",
             original_size=1024,
             timestamp="2024-01-01T00:00:00Z"
@@ -95,6 +101,29 @@ class TestE4PContainer:
         
         serialized = container.serialize_header(header)
         
+        # Check magic bytes
+        assert serialized[:4] == E4P_MAGIC_V2
+        
+        # Raw salt, nonce and name follow the fixed fields, then the CRC
+        assert serialized[:-4].endswith(b"test_salt_16_byte" + b"test_nonce12" + b"test.txt")
+        assert serialized[-4:] == zlib.crc32(serialized[:-4]).to_bytes(4, 'little')
+    
+    def test_deserialize_v1_header(self):
+        """Test that legacy JSON headers are still parsed."""
+        container = E4PContainer("AES-256-GCM")
+        header = E4PHeader(
+            algorithm="AES-256-GCM",
+            kdf="argon2id",
+            kdf_params={"m": 262144, "t": 3, "p": 2},
+            salt=b"test_salt_16_byte",
+            nonce=b"test_nonce12",
+            original_name="test.txt",
+            original_size=1024,
+            timestamp="2024-01-01T00:00:00.123456Z"
+        )
+        
+        serialized = container.serialize_header_v1(header)
+        
         # Check magic bytes
         assert serialized[:4] == E4P_MAGIC
         
@@ -107,6 +136,86 @@ class TestE4PContainer:
         header_data = json.loads(json_data.decode('utf-8'))
         assert header_data["alg"] == "AES-256-GCM"
         assert header_data["orig_name"] == "test.txt"
+        
+        assert container.deserialize_header(serialized) == (header, len(serialized))
+    
+    def test_v2_header_roundtrip(self):
+        """Test that every field survives the binary layout."""
+        container = E4PContainer("XCHACHA20-POLY1305")
+        header = container.create_header(b"s" * 32, b"n" * 24, "файл.txt", 12345)
+        
+        serialized = container.serialize_header(header)
+        
+        assert container.deserialize_header(serialized + b"payload") == (header, len(serialized))
+    
+    def test_v1_xchacha_label_maps_to_xsalsa(self):
+        """Test that E4P1 XChaCha20 labels read back as the secretbox cipher."""
+        container = E4PContainer("XSALSA20-POLY1305")
+        header = container.create_header(b"s" * 32, b"n" * 24, "test.txt", 1024)
+        
+        serialized = container.serialize_header_v1(header)
+        header_len = int.from_bytes(serialized[4:8], 'little')
+        
+        assert json.loads(serialized[8:8 + header_len])["alg"] == "XCHACHA20-POLY1305"
+        assert container.deserialize_header(serialized)[0].algorithm == "XSALSA20-POLY1305"
+        
+        with pytest.raises(ValueError):
+            E4PContainer("XCHACHA20-POLY1305").serialize_header_v1(
+                E4PContainer("XCHACHA20-POLY1305").create_header(b"s" * 32, b"n" * 24, "test.txt", 1024)
+            )
+    
+    def test_v2_algorithm_codes(self):
+        """Test that secretbox keeps code 2 and IETF XChaCha20 uses code 3."""
+        for algorithm, code in (("XSALSA20-POLY1305", 2), ("XCHACHA20-POLY1305", 3)):
+            container = E4PContainer(algorithm)
+            header = container.create_header(b"s" * 32, b"n" * 24, "test.txt", 1024)
+            serialized = container.serialize_header(header)
+            
+            assert serialized[4] == code
+            assert container.deserialize_header(serialized)[0].algorithm == algorithm
+    
+    def test_header_holds_raw_bytes(self):
+        """Test that salt and nonce stay raw bytes and are base64 only in dicts."""
+        container = E4PContainer("AES-256-GCM")
+        header = container.create_header(b"s" * 32, b"n" * 12, "test.txt", 1024)
+        
+        parsed, _ = container.deserialize_header(container.serialize_header(header))
+        
+        assert parsed.salt == b"s" * 32
+        assert parsed.nonce == b"n" * 12
+        assert not hasattr(parsed, "__dict__")
+        
+        header_dict = parsed.to_dict()
+        assert header_dict["salt"] == base64.b64encode(b"s" * 32).decode('ascii')
+        assert E4PHeader.from_dict(header_dict) == parsed
+        
+        with pytest.raises(ValueError):
+            E4PHeader.from_dict({**header_dict, "salt": "invalid_base64!"})
+    
+    def test_v2_header_checksum(self):
+        """Test that a corrupted header is rejected and CRC-less headers still parse."""
+        container = E4PContainer("AES-256-GCM")
+        header = container.create_header(b"s" * 32, b"n" * 12, "test.txt", 1024)
+        serialized = container.serialize_header(header)
+        
+        corrupted = bytearray(serialized)
+        corrupted[-6] ^= 0x01  # flip a bit in the name
+        with pytest.raises(ValueError, match="checksum"):
+            container.deserialize_header(bytes(corrupted))
+        
+        # Headers written before the flag existed have flags 0 and no CRC
+        without_crc = bytearray(serialized[:-4])
+        without_crc[6] = 0
+        assert container.deserialize_header(bytes(without_crc)) == (header, len(without_crc))
+    
+    def test_deserialize_v2_incomplete(self):
+        """Test that a truncated binary header is rejected."""
+        container = E4PContainer("AES-256-GCM")
+        header = container.create_header(b"s" * 32, b"n" * 12, "test.txt", 1024)
+        serialized = container.serialize_header(header)
+        
+        with pytest.raises(ValueError, match="incomplete header"):
+            container.deserialize_header(serialized[:-1])
     
     def test_deserialize_header(self):
         """Test header deserialization."""
@@ -115,8 +224,8 @@ class TestE4PContainer:
             algorithm="AES-256-GCM",
             kdf="argon2id",
             kdf_params={"m": 262144, "t": 3, "p": 2},
-            salt="dGVzdF9zYWx0",
-            nonce="dGVzdF9ub25jZQ==",
+            salt=b"test_salt_16_byte",
+            nonce=b"test_nonce12",
             original_name="test.txt",
             original_size=1024,
             timestamp="2024-01-01T00:00:00Z"
@@ -155,8 +264,8 @@ class TestE4PContainer:
             algorithm="AES-256-GCM",
             kdf="argon2id",
             kdf_params={"m": 262144, "t": 3, "p": 2},
-            salt="dGVzdF9zYWx0",
-            nonce="dGVzdF9ub25jZQ==",
+            salt=b"test_salt_16_byte",
+            nonce=b"test_nonce12",
             original_name="test.txt",
             original_size=1024,
             timestamp="2024-01-01T00:00:00Z"
@@ -171,8 +280,8 @@ class TestE4PContainer:
             algorithm="INVALID_ALGORITHM",
             kdf="argon2id",
             kdf_params={"m": 262144, "t": 3, "p": 2},
-            salt="dGVzdF9zYWx0",
-            nonce="dGVzdF9ub25jZQ==",
+            salt=b"test_salt_16_byte",
+            nonce=b"test_nonce12",
             original_name="test.txt",
             original_size=1024,
             timestamp="2024-01-01T00:00:00Z"
@@ -187,8 +296,8 @@ class TestE4PContainer:
             algorithm="AES-256-GCM",
             kdf="invalid_kdf",
             kdf_params={"m": 262144, "t": 3, "p": 2},
-            salt="dGVzdF9zYWx0",
-            nonce="dGVzdF9ub25jZQ==",
+            salt=b"test_salt_16_byte",
+            nonce=b"test_nonce12",
             original_name="test.txt",
             original_size=1024,
             timestamp="2024-01-01T00:00:00Z"
@@ -203,8 +312,8 @@ class TestE4PContainer:
             algorithm="AES-256-GCM",
             kdf="argon2id",
             kdf_params={"m": 100, "t": 0, "p": 0},  # Invalid parameters
-            salt="dGVzdF9zYWx0",
-            nonce="dGVzdF9ub25jZQ==",
+            salt=b"test_salt_16_byte",
+            nonce=b"test_nonce12",
             original_name="test.txt",
             original_size=1024,
             timestamp="2024-01-01T00:00:00Z"
@@ -219,8 +328,8 @@ class TestE4PContainer:
             algorithm="AES-256-GCM",
             kdf="argon2id",
             kdf_params={"m": 262144, "t": 3, "p": 2},
-            salt="invalid_base64!",
-            nonce="dGVzdF9ub25jZQ==",
+            salt=b"short_salt",
+            nonce=b"test_nonce12",
             original_name="test.txt",
             original_size=1024,
             timestamp="2024-01-01T00:00:00Z"
@@ -228,6 +337,24 @@ class TestE4PContainer:
         
         assert container.validate_header(header) is False
     
+    def test_validate_and_decode_header(self):
+        """Test decoding salt and nonce alongside validation."""
+        container = E4PContainer("AES-256-GCM")
+        header = container.create_header(b"s" * 32, b"n" * 12, "test.txt", 1024)
+        
+        valid, salt, nonce = container.validate_and_decode_header(header)
+        
+        assert valid is True
+        assert salt == b"s" * 32
+        assert nonce == b"n" * 12
+    
+    def test_validate_and_decode_header_wrong_nonce_size(self):
+        """Test that a nonce of the wrong length for the algorithm is rejected."""
+        container = E4PContainer("XCHACHA20-POLY1305")
+        header = container.create_header(b"s" * 32, b"n" * 12, "test.txt", 1024)
+        
+        assert container.validate_and_decode_header(header) == (False, None, None)
+    
     def test_get_expected_nonce_size(self):
         """Test getting expected nonce size for algorithms."""
         container = E4PContainer("AES-256-GCM")
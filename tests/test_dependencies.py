@@ -0,0 +1,32 @@
+"""Tests for shared service dependencies and the app lifespan."""
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.dependencies import get_processor, get_storage, get_task_manager, get_tokens
+
+
+class TestDependencies:
+    """Test lifespan-managed service instances."""
+    
+    def test_lifespan_shares_instances(self):
+        """Test that routes and the lifespan see the same instances."""
+        with TestClient(app) as client:
+            assert get_storage() is get_storage()
+            assert get_task_manager() is get_task_manager()
+            assert get_tokens() is get_tokens()
+            assert get_task_manager().token_manager is get_tokens()
+            assert get_task_manager().processor is get_processor()
+            
+            response = client.get("/health")
+            assert response.status_code == 200
+        
+        # Shutdown drops the instances so the next startup builds fresh ones
+        assert get_storage.cache_info().currsize == 0
+        assert get_task_manager.cache_info().currsize == 0
+    
+    def test_unknown_task_status(self):
+        """Test that the injected task manager answers status requests."""
+        with TestClient(app) as client:
+            response = client.get("/api/status/missing")
+            assert response.status_code == 404
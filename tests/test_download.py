@@ -0,0 +1,36 @@
+"""Tests for download endpoints."""
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.dependencies import get_tokens
+from app.routes.download import content_disposition
+
+
+class TestDownload:
+    """Test token-based file downloads."""
+    
+    def test_content_disposition(self):
+        """Test the ASCII fallback and the RFC 5987 encoded name."""
+        value = content_disposition('résumé "final".pdf')
+        assert value == (
+            'attachment; filename="r_sum_ _final_.pdf"; '
+            "filename*=UTF-8''r%C3%A9sum%C3%A9%20%22final%22.pdf"
+        )
+    
+    def test_download_stream(self, tmp_path):
+        """Test that a valid token serves the file with its disposition."""
+        file_path = tmp_path / "data.bin"
+        file_path.write_bytes(b"download me")
+        
+        with TestClient(app) as client:
+            token = get_tokens().create_download_token(str(file_path), "data.bin")
+            
+            for endpoint in ("/download", "/download-stream"):
+                response = client.get(f"{endpoint}/{token}")
+                assert response.status_code == 200
+                assert response.content == b"download me"
+                assert response.headers["content-type"] == "application/octet-stream"
+                assert response.headers["content-disposition"] == content_disposition("data.bin")
+            
+            assert client.get("/download/invalid").status_code == 400
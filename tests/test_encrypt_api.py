@@ -0,0 +1,98 @@
+"""Tests for the encryption API endpoints."""
+
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.routes.encrypt import _stream_then_delete
+
+
+class TestEncryptAPI:
+    """Test upload validation in the encryption endpoints."""
+    
+    def test_too_large_upload_cleaned_up(self, monkeypatch):
+        """Test that a rejected batch leaves no files behind."""
+        monkeypatch.setattr(settings, "max_file_size_mb", 0)
+        before = set(os.listdir(settings.temp_dir))
+        
+        with TestClient(app) as client:
+            response = client.post(
+                "/api/encrypt",
+                files=[("files", ("a.txt", b"data")), ("files", ("b.txt", b"more"))],
+                data={"password": "password"}
+            )
+        
+        assert response.status_code == 413
+        assert "a.txt" in response.json()["detail"]
+        assert set(os.listdir(settings.temp_dir)) == before
+    
+    def test_encrypt_creates_task(self):
+        """Test that valid uploads create a pending task."""
+        with TestClient(app) as client:
+            response = client.post(
+                "/api/encrypt",
+                files=[("files", ("a.txt", b"data"))],
+                data={"password": "password"}
+            )
+            
+            assert response.status_code == 200
+            body = response.json()
+            assert body["status"] == "pending"
+            assert body["files"] == [{"original_name": "a.txt", "size": 4}]
+            
+            client.delete(f"/api/task/{body['task_id']}")
+    
+    def test_stream_round_trip_keeps_filename(self):
+        """Test that decryption restores the uploaded filename."""
+        with TestClient(app) as client:
+            encrypted = client.post(
+                "/api/encrypt-stream",
+                files={"file": ("a.txt", b"data")},
+                data={"password": "password"}
+            )
+            assert encrypted.status_code == 200
+            assert "a.txt.e4p" in encrypted.headers["content-disposition"]
+            
+            decrypted = client.post(
+                "/api/decrypt",
+                files={"file": ("a.txt.e4p", encrypted.content)},
+                data={"password": "password"}
+            )
+            
+            assert decrypted.status_code == 200
+            assert decrypted.json()["filename"] == "a.txt"
+    
+    @pytest.mark.asyncio
+    async def test_stream_error_deletes_upload(self, tmp_path):
+        """Test that the plaintext upload is removed when encryption fails mid-stream."""
+        temp_path = tmp_path / "upload.txt"
+        temp_path.write_bytes(b"plaintext")
+        
+        async def body():
+            yield b"header"
+            raise ValueError("encryption failed")
+        
+        with pytest.raises(ValueError):
+            async for _ in _stream_then_delete(body(), temp_path):
+                pass
+        
+        assert not temp_path.exists()
+    
+    @pytest.mark.asyncio
+    async def test_closed_stream_deletes_upload(self, tmp_path):
+        """Test that the plaintext upload is removed when the client goes away."""
+        temp_path = tmp_path / "upload.txt"
+        temp_path.write_bytes(b"plaintext")
+        
+        async def body():
+            yield b"header"
+            yield b"chunk"
+        
+        stream = _stream_then_delete(body(), temp_path)
+        assert await anext(stream) == b"header"
+        await stream.aclose()
+        
+        assert not temp_path.exists()
@@ -1,7 +1,44 @@
 """Tests for key derivation functions."""
 
 import pytest
-from app.crypto.kdf import derive_key, generate_salt, verify_key_derivation
+from functools import lru_cache
+from app.config import Settings, settings
+from app.crypto import kdf
+from app.crypto.kdf import aderive_key, derive_key, generate_salt, verify_key_derivation
+from app.crypto.kdf_cache import KeyCache
+
+
+# Argon2id is deliberately slow; tests that only need some key reuse
+# results for repeated (password, salt) pairs
+_dk = lru_cache(maxsize=64)(derive_key)
+
+_KEY_LEN = 32
+_PASSWORD = "test_password_123"
+_LONG_PASSWORD = "a" * 1000
+_UNICODE_PASSWORD = "پسورد_فارسی_123"
+
+# Fixed salts with the same length generate_salt() produces
+_SALT_A = bytes.fromhex("00" * 32)
+_SALT_B = bytes.fromhex("01" * 32)
+
+
+def _assert_key(key):
+    """Check that a derived key is raw bytes of the expected length."""
+    assert isinstance(key, bytes) and len(key) == _KEY_LEN
+
+
+@pytest.fixture(scope="module")
+def salt():
+    """Random salt shared by tests where its value does not matter."""
+    return generate_salt()
+
+
+@pytest.fixture
+def known_key(salt):
+    """Key for _PASSWORD and the shared salt, derived once through _dk."""
+    # Function scope so it is derived under the same Argon2id cost as the
+    # test; _dk still makes it a single derivation per run
+    return _dk(_PASSWORD, salt)
 
 
 class TestKDF:
@@ -18,23 +55,16 @@ class TestKDF:
     
     def test_derive_key_deterministic(self):
         """Test that key derivation is deterministic with same inputs."""
-        password = "test_password_123"
-        salt = b"test_salt_32_bytes_long_12345"
-        
-        key1 = derive_key(password, salt)
-        key2 = derive_key(password, salt)
+        key1 = derive_key(_PASSWORD, _SALT_A)
+        key2 = _dk(_PASSWORD, _SALT_A)
         
         assert key1 == key2
-        assert len(key1) == 32  # Should be 32 bytes
+        _assert_key(key1)
     
     def test_derive_key_different_salts(self):
         """Test that different salts produce different keys."""
-        password = "test_password_123"
-        salt1 = b"test_salt_1_32_bytes_long_1234"
-        salt2 = b"test_salt_2_32_bytes_long_1234"
-        
-        key1 = derive_key(password, salt1)
-        key2 = derive_key(password, salt2)
+        key1 = _dk(_PASSWORD, _SALT_A)
+        key2 = _dk(_PASSWORD, _SALT_B)
         
         assert key1 != key2
     
@@ -42,51 +72,107 @@ class TestKDF:
         """Test that different passwords produce different keys."""
         password1 = "password1"
         password2 = "password2"
-        salt = b"same_salt_32_bytes_long_12345"
+        salt = _SALT_A
         
-        key1 = derive_key(password1, salt)
-        key2 = derive_key(password2, salt)
+        key1 = _dk(password1, salt)
+        key2 = _dk(password2, salt)
         
         assert key1 != key2
     
-    def test_verify_key_derivation_correct(self):
+    def test_verify_key_derivation_correct(self, salt, known_key):
         """Test key verification with correct password."""
-        password = "test_password_123"
-        salt = generate_salt()
-        expected_key = derive_key(password, salt)
-        
-        assert verify_key_derivation(password, salt, expected_key) is True
+        assert verify_key_derivation(_PASSWORD, salt, known_key) is True
     
-    def test_verify_key_derivation_incorrect(self):
+    def test_verify_key_derivation_incorrect(self, salt, known_key):
         """Test key verification with incorrect password."""
-        password = "test_password_123"
-        wrong_password = "wrong_password"
-        salt = generate_salt()
-        expected_key = derive_key(password, salt)
+        assert verify_key_derivation("wrong_password", salt, known_key) is False
+    
+    def test_verify_key_derivation_constant_time(self, salt, known_key, monkeypatch):
+        """Test that verification compares keys with hmac.compare_digest."""
+        calls = []
+        real_compare = kdf.hmac.compare_digest
+        
+        def spy(a, b):
+            calls.append((a, b))
+            return real_compare(a, b)
+        
+        monkeypatch.setattr(kdf.hmac, "compare_digest", spy)
+        
+        assert verify_key_derivation(_PASSWORD, salt, known_key) is True
+        assert calls == [(known_key, known_key)]
+    
+    @pytest.mark.parametrize(
+        "password",
+        ["", _UNICODE_PASSWORD, _LONG_PASSWORD],
+        ids=["empty", "unicode", "long"]
+    )
+    def test_derive_key_unusual_passwords(self, salt, password):
+        """Test key derivation with empty, Unicode and very long passwords."""
+        _assert_key(_dk(password, salt))
+    
+    @pytest.mark.slow
+    def test_derive_key_production_cost(self, salt):
+        """Test one derivation with the configured Argon2id cost."""
+        assert settings.argon2_memory_mb == Settings().argon2_memory_mb
+        
+        key = derive_key("production_password", salt)
+        assert len(key) == settings.argon2_key_len
+        assert verify_key_derivation("production_password", salt, key) is True
+    
+    @pytest.mark.asyncio
+    async def test_aderive_key_matches_sync(self, salt):
+        """Test that the pooled async derivation matches derive_key."""
+        password = "async_password"
         
-        assert verify_key_derivation(wrong_password, salt, expected_key) is False
+        assert await aderive_key(password, salt) == _dk(password, salt)
+
+
+class TestKeyCache:
+    """Test derived key caching."""
     
-    def test_derive_key_empty_password(self):
-        """Test key derivation with empty password."""
-        password = ""
+    def test_cache_hit(self):
+        """Test that a stored key is returned for the same password and salt."""
+        cache = KeyCache()
         salt = generate_salt()
+        key = _dk("test_password", salt)
         
-        # Should not raise an exception
-        key = derive_key(password, salt)
-        assert len(key) == 32
+        assert cache.get("test_password", salt) is None
+        cache.put("test_password", salt, key)
+        assert cache.get("test_password", salt) == key
+        assert cache.get("other_password", salt) is None
     
-    def test_derive_key_unicode_password(self):
-        """Test key derivation with Unicode password."""
-        password = "پسورد_فارسی_123"
+    def test_cache_keyed_by_kdf_params(self):
+        """Test that a key cached for one Argon2id cost is not returned for another."""
+        cache = KeyCache()
         salt = generate_salt()
+        cache.put("test_password", salt, b"k" * 32, {"m": 1024, "t": 1, "p": 1})
         
-        key = derive_key(password, salt)
-        assert len(key) == 32
+        assert cache.get("test_password", salt, {"m": 1024, "t": 1, "p": 1}) == b"k" * 32
+        assert cache.get("test_password", salt, {"m": 1024, "t": 2, "p": 1}) is None
     
-    def test_derive_key_long_password(self):
-        """Test key derivation with very long password."""
-        password = "a" * 1000  # Very long password
+    def test_cache_does_not_store_password(self):
+        """Test that entries are keyed by digest, not the plaintext password."""
+        cache = KeyCache()
+        cache.put("test_password", generate_salt(), b"k" * 32)
+        
+        assert all(b"test_password" not in entry for entry in cache._entries)
+    
+    def test_cache_expiry(self):
+        """Test that expired entries are dropped."""
+        cache = KeyCache(ttl=0)
         salt = generate_salt()
+        cache.put("test_password", salt, b"k" * 32)
+        
+        assert cache.get("test_password", salt) is None
+        assert len(cache) == 0
+    
+    def test_cache_eviction(self):
+        """Test that the least recently used entry is evicted."""
+        cache = KeyCache(maxsize=2)
+        salts = [generate_salt() for _ in range(3)]
+        for salt in salts:
+            cache.put("test_password", salt, b"k" * 32)
         
-        key = derive_key(password, salt)
-        assert len(key) == 32
+        assert len(cache) == 2
+        assert cache.get("test_password", salts[0]) is None
+        assert cache.get("test_password", salts[2]) == b"k" * 32
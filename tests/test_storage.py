@@ -0,0 +1,152 @@
+"""Tests for temporary file storage."""
+
+import io
+import os
+import time
+import pytest
+from fastapi import UploadFile
+
+from app.config import settings
+from app.services.storage import StorageManager, UploadTooLargeError, drop_page_cache
+
+
+class TestStorageManager:
+    """Test upload handling in the storage manager."""
+    
+    @pytest.mark.asyncio
+    async def test_save_upload_stream(self):
+        """Test that an upload is copied to disk intact."""
+        storage_manager = StorageManager()
+        content = os.urandom(3 * 1024 * 1024 + 7)  # Spans several read pieces
+        
+        try:
+            upload = UploadFile(io.BytesIO(content), filename="upload.bin")
+            temp_path = await storage_manager.save_upload_stream(upload, "upload.bin")
+            
+            assert temp_path.read_bytes() == content
+            await storage_manager.delete_file(temp_path)
+        finally:
+            await storage_manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_save_upload_stream_too_large(self):
+        """Test that an oversized upload is rejected and not left on disk."""
+        storage_manager = StorageManager()
+        
+        try:
+            upload = UploadFile(io.BytesIO(b"x" * 2048), filename="big.bin")
+            before = set(storage_manager.temp_dir.iterdir())
+            
+            with pytest.raises(UploadTooLargeError):
+                await storage_manager.save_upload_stream(upload, "big.bin", max_size=1024)
+            
+            assert set(storage_manager.temp_dir.iterdir()) == before
+        finally:
+            await storage_manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_cleanup_old_files(self, tmp_path):
+        """Test that only files past the TTL are removed, including nested ones."""
+        storage_manager = StorageManager()
+        storage_manager.temp_dir = tmp_path
+        
+        nested = tmp_path / "nested"
+        nested.mkdir()
+        old_file = nested / "old.bin"
+        new_file = tmp_path / "new.bin"
+        old_file.write_bytes(b"old")
+        new_file.write_bytes(b"new")
+        old_time = time.time() - (settings.file_ttl_min + 1) * 60
+        os.utime(old_file, (old_time, old_time))
+        
+        try:
+            await storage_manager.cleanup_old_files()
+            
+            assert not old_file.exists()
+            assert new_file.exists()
+            assert nested.is_dir()
+        finally:
+            await storage_manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_create_temp_file_unique(self):
+        """Test that temp files for the same name are distinct and created."""
+        storage_manager = StorageManager()
+        
+        try:
+            paths = [storage_manager.create_temp_file('a<b>|c.txt', suffix=".e4p") for _ in range(5)]
+            
+            assert len(set(paths)) == 5
+            for path in paths:
+                assert path.exists()
+                assert path.name.startswith("a_b__c.e4p_")
+                assert path.suffix == ".txt"
+                await storage_manager.delete_file(path)
+            
+            long_path = storage_manager.create_temp_file("x" * 300 + ".bin")
+            assert len(long_path.name) <= 255
+            await storage_manager.delete_file(long_path)
+        finally:
+            await storage_manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_file_operations(self, tmp_path):
+        """Test copy, move and delete on the storage I/O pool."""
+        storage_manager = StorageManager()
+        source = tmp_path / "source.bin"
+        source.write_bytes(b"payload")
+        
+        try:
+            await storage_manager.copy_file(source, tmp_path / "copy.bin")
+            await storage_manager.move_file(tmp_path / "copy.bin", tmp_path / "moved.bin")
+            assert (tmp_path / "moved.bin").read_bytes() == b"payload"
+            assert not (tmp_path / "copy.bin").exists()
+            
+            await storage_manager.delete_file(tmp_path / "moved.bin")
+            await storage_manager.delete_file(tmp_path / "missing.bin")
+            assert not (tmp_path / "moved.bin").exists()
+        finally:
+            await storage_manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_get_file_info_fd(self, tmp_path):
+        """Test that descriptor-based info matches path-based info."""
+        storage_manager = StorageManager()
+        file_path = tmp_path / "info.bin"
+        file_path.write_bytes(b"x" * 42)
+        
+        try:
+            with open(file_path, 'rb') as f:
+                assert storage_manager.get_file_info_fd(f.fileno()) == storage_manager.get_file_info(file_path)
+            assert storage_manager.get_file_info_fd(-1) is None
+        finally:
+            await storage_manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_cleanup_task_files(self, tmp_path):
+        """Test that all of a task's files are removed, tolerating missing ones."""
+        storage_manager = StorageManager()
+        task_files = []
+        for i in range(3):
+            temp_path = tmp_path / f"in{i}"
+            temp_path.write_bytes(b"plain")
+            task_files.append({
+                "temp_path": str(temp_path),
+                "encrypted_path": str(tmp_path / f"out{i}.e4p")
+            })
+        (tmp_path / "out0.e4p").write_bytes(b"cipher")
+        
+        try:
+            await storage_manager.cleanup_task_files(task_files)
+            assert list(tmp_path.iterdir()) == []
+        finally:
+            await storage_manager.shutdown()
+    
+    def test_drop_page_cache(self, tmp_path):
+        """Test that the page cache hint is a no-op for missing files."""
+        file_path = tmp_path / "cached.bin"
+        file_path.write_bytes(b"x" * 4096)
+        
+        drop_page_cache(file_path)
+        drop_page_cache(tmp_path / "missing.bin")
+        assert file_path.read_bytes() == b"x" * 4096
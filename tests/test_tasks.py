@@ -0,0 +1,204 @@
+"""Tests for encryption task management."""
+
+import asyncio
+
+import pytest
+
+from app.services.tasks import TaskManager, TaskStoreFullError
+
+
+class TestTaskManager:
+    """Test task tracking and status reporting."""
+    
+    @pytest.mark.asyncio
+    async def test_task_completes(self, tmp_path):
+        """Test that a queued task encrypts its file and reports completion."""
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(b"task data")
+        files = [{
+            "original_name": "input.txt",
+            "temp_path": str(input_path),
+            "encrypted_path": str(tmp_path / "input.txt.e4p")
+        }]
+        
+        manager = TaskManager()
+        try:
+            task_id = await manager.create_task(files, "password")
+            for _ in range(200):
+                if manager.is_finished(task_id):
+                    break
+                await asyncio.sleep(0.05)
+            
+            status = manager.get_task_status(task_id)
+            assert status["status"] == "completed"
+            assert status["progress"] == 100.0
+            assert status["completed_at"] is not None
+            assert "download_token" in status["files"][0]
+            assert "temp_path" not in status["files"][0]
+            assert "encrypted_path" not in status["files"][0]
+            assert "header" in files[0]
+        finally:
+            await manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_multiple_files_encrypted(self, tmp_path):
+        """Test that every file of a multi-file task is encrypted."""
+        files = []
+        for i in range(3):
+            input_path = tmp_path / f"input{i}.txt"
+            input_path.write_bytes(b"file %d" % i)
+            files.append({
+                "original_name": input_path.name,
+                "temp_path": str(input_path),
+                "encrypted_path": str(tmp_path / f"input{i}.txt.e4p")
+            })
+        
+        manager = TaskManager(max_concurrency=2)
+        try:
+            task_id = await manager.create_task(files, "password")
+            for _ in range(200):
+                if manager.is_finished(task_id):
+                    break
+                await asyncio.sleep(0.05)
+            
+            status = manager.get_task_status(task_id)
+            assert status["status"] == "completed"
+            assert status["progress"] == 100.0
+            assert len({f["download_token"] for f in status["files"]}) == 3
+            assert len({f["header"]["nonce"] for f in files}) == 3
+        finally:
+            await manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_failed_file_stops_task(self, tmp_path):
+        """Test that one failing file fails the task and leaves no partial outputs."""
+        good_path = tmp_path / "good.txt"
+        good_path.write_bytes(b"x" * (1 << 20))
+        files = [
+            {
+                "original_name": "missing.txt",
+                "temp_path": str(tmp_path / "missing.txt"),
+                "encrypted_path": str(tmp_path / "missing.txt.e4p")
+            },
+            {
+                "original_name": "good.txt",
+                "temp_path": str(good_path),
+                "encrypted_path": str(tmp_path / "good.txt.e4p")
+            }
+        ]
+        
+        manager = TaskManager()
+        try:
+            task_id = await manager.create_task(files, "password")
+            await manager.queue.join()
+            
+            status = manager.get_task_status(task_id)
+            assert status["status"] == "failed"
+            assert "missing.txt" in status["error_message"]
+            for file_info in files:
+                output = tmp_path / f"{file_info['original_name']}.e4p"
+                assert output.exists() == ("download_token" in file_info)
+        finally:
+            await manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_cancel_during_processing_is_kept(self, tmp_path, monkeypatch):
+        """Test that a cancel landing mid-task is not overwritten by completion."""
+        input_path = tmp_path / "input.txt"
+        input_path.write_bytes(b"task data")
+        files = [{
+            "original_name": "input.txt",
+            "temp_path": str(input_path),
+            "encrypted_path": str(tmp_path / "input.txt.e4p")
+        }]
+        
+        manager = TaskManager()
+        encrypt = manager.processor.encrypt_file_with_size
+        
+        async def cancel_then_encrypt(**kwargs):
+            manager.fail_task(task_id, "Task cancelled by user")
+            return await encrypt(**kwargs)
+        
+        monkeypatch.setattr(manager.processor, "encrypt_file_with_size", cancel_then_encrypt)
+        try:
+            task_id = await manager.create_task(files, "password")
+            await manager.queue.join()
+            
+            status = manager.get_task_status(task_id)
+            assert status["status"] == "failed"
+            assert status["error_message"] == "Task cancelled by user"
+            assert not (tmp_path / "input.txt.e4p").exists()
+        finally:
+            await manager.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_oldest_tasks_evicted(self):
+        """Test that the oldest finished tasks are evicted to stay within the bound."""
+        manager = TaskManager(max_tasks=3)
+        await manager.shutdown()
+        
+        task_ids = [await manager.create_task([], "password") for _ in range(3)]
+        manager.fail_task(task_ids[0], "done")
+        manager.fail_task(task_ids[2], "done")
+        
+        task_ids += [await manager.create_task([], "password") for _ in range(2)]
+        
+        assert len(manager.tasks) == 3
+        assert manager.get_task_status(task_ids[0]) is None
+        assert manager.get_task_status(task_ids[1])["status"] == "pending"
+        assert manager.get_task_status(task_ids[2]) is None
+        assert manager.get_task_status(task_ids[-1])["status"] == "pending"
+    
+    @pytest.mark.asyncio
+    async def test_full_store_of_pending_tasks_rejects_new_task(self):
+        """Test that pending tasks are never evicted to make room."""
+        manager = TaskManager(max_tasks=3)
+        await manager.shutdown()
+        
+        task_ids = [await manager.create_task([], "password") for _ in range(3)]
+        
+        with pytest.raises(TaskStoreFullError):
+            await manager.create_task([], "password")
+        
+        assert len(manager.tasks) == 3
+        assert all(
+            manager.get_task_status(task_id)["status"] == "pending"
+            for task_id in task_ids
+        )
+    
+    @pytest.mark.asyncio
+    async def test_fail_task(self):
+        """Test marking a pending task as failed."""
+        manager = TaskManager()
+        await manager.shutdown()
+        
+        task_id = await manager.create_task([], "password")
+        assert not manager.is_finished(task_id)
+        
+        manager.fail_task(task_id, "Task cancelled by user")
+        status = manager.get_task_status(task_id)
+        assert status["status"] == "failed"
+        assert status["error_message"] == "Task cancelled by user"
+        assert manager.is_finished(task_id)
+    
+    @pytest.mark.asyncio
+    async def test_worker_pool(self):
+        """Test that one worker runs per concurrency slot and all stop on shutdown."""
+        manager = TaskManager(max_concurrency=3)
+        workers = list(manager._workers)
+        assert len(workers) == 3
+        
+        await manager.shutdown()
+        assert all(worker.done() for worker in workers)
+        assert manager._workers == []
+    
+    @pytest.mark.asyncio
+    async def test_task_record_is_slotted(self):
+        """Test that task records carry no per-instance __dict__."""
+        manager = TaskManager()
+        await manager.shutdown()
+        
+        task_id = await manager.create_task([], "password")
+        task = manager.get_task(task_id)
+        assert not hasattr(task, "__dict__")
+        assert task.created_at is not None
@@ -0,0 +1,88 @@
+"""Tests for download token management."""
+
+import base64
+import time
+
+from app.config import settings
+from app.services.tokens import TokenManager
+
+
+class TestTokenManager:
+    """Test download token creation and validation."""
+    
+    def test_token_roundtrip(self):
+        """Test that a fresh token validates to its original data."""
+        manager = TokenManager()
+        token = manager.create_download_token("/tmp/e4p/file.e4p", "report.pdf.e4p")
+        
+        data = manager.validate_token(token)
+        assert data is not None
+        assert data["file_path"] == "/tmp/e4p/file.e4p"
+        assert data["filename"] == "report.pdf.e4p"
+        assert data["expires"] == data["timestamp"] + manager.token_ttl
+    
+    def test_path_with_separator_characters(self):
+        """Test that paths and names containing '|' or '.' roundtrip."""
+        manager = TokenManager()
+        token = manager.create_download_token("/tmp/a|b.c/file", "ö|name.txt")
+        
+        data = manager.validate_token(token)
+        assert data["file_path"] == "/tmp/a|b.c/file"
+        assert data["filename"] == "ö|name.txt"
+    
+    def test_tampered_token_rejected(self):
+        """Test that modifying any byte invalidates the token."""
+        manager = TokenManager()
+        token = manager.create_download_token("/tmp/e4p/file", "file.txt")
+        raw = bytearray(base64.urlsafe_b64decode(token))
+        raw[20] ^= 0x01
+        tampered = base64.urlsafe_b64encode(bytes(raw)).decode('utf-8')
+        
+        assert manager.validate_token(tampered) is None
+        assert manager.get_token_info(tampered) is None
+        assert manager.validate_token("not-a-token") is None
+    
+    def test_expired_token(self):
+        """Test that expired tokens fail validation but still report info."""
+        manager = TokenManager()
+        manager.token_ttl = -10
+        token = manager.create_download_token("/tmp/e4p/file", "file.txt")
+        
+        assert manager.validate_token(token) is None
+        assert not manager.is_token_valid(token)
+        
+        info = manager.get_token_info(token)
+        assert info["filename"] == "file.txt"
+        assert info["is_expired"] is True
+    
+    def test_token_info(self):
+        """Test token info for a valid token."""
+        manager = TokenManager()
+        token = manager.create_download_token("/tmp/e4p/file", "file.txt")
+        
+        info = manager.get_token_info(token)
+        assert info["filename"] == "file.txt"
+        assert info["is_expired"] is False
+        assert info["expires"] > time.time()
+        assert "file_path" not in info
+    
+    def test_long_secret_key(self, monkeypatch):
+        """Test that secrets longer than the BLAKE2b key limit still work."""
+        monkeypatch.setattr(settings, "secret_key", "k" * 100)
+        manager = TokenManager()
+        token = manager.create_download_token("/tmp/e4p/file", "file.txt")
+        
+        assert manager.validate_token(token) is not None
+        
+        monkeypatch.setattr(settings, "secret_key", "j" * 100)
+        assert TokenManager().validate_token(token) is None
+    
+    def test_malformed_tokens_rejected(self):
+        """Test that bad lengths and encodings are rejected without errors."""
+        manager = TokenManager()
+        token = manager.create_download_token("", "")
+        assert manager.validate_token(token) is not None
+        
+        for bad in ("", token[:-4], "A" * 200000, "é" * 80, "!" * 80, token[:-1]):
+            assert manager.validate_token(bad) is None
+            assert manager.get_token_info(bad) is None